@@ -1,25 +1,130 @@
+"""
+Password hashing with bcrypt.
+
+Hashes are made and checked on a small dedicated thread pool, so a burst
+of logins cannot starve the event loop or the request threadpool: bcrypt
+releases the GIL, at most `password_hash_workers` hashes run at once,
+and callers beyond `password_hash_max_queue` waiting ones are turned away
+with 503 instead of queueing without bound.
+
+Records from before bcrypt use a salted SHA-256 (`salt$hash`); they are
+still verified and get rehashed on the next successful login.
+"""
+import asyncio
 import hashlib
-import secrets
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, TypeVar
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.config import settings
+from app.metrics import Counter, Gauge, Metric
+
+T = TypeVar("T")
+
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=settings.password_bcrypt_rounds)
+
+
+def is_legacy_hash(hashed_password: str) -> bool:
+    return not hashed_password.startswith("$")
+
+
+def _verify_legacy_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        salt, hash_value = hashed_password.split('$')
+    except ValueError:
+        return False
+    password_hash = hashlib.sha256((salt + plain_password).encode('utf-8')).hexdigest()
+    return hmac.compare_digest(password_hash, hash_value)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    Verify a password against a hashed password.
-    Format: salt$hash
+    Verify a password against a bcrypt hash or a legacy salt$hash record.
     """
+    if is_legacy_hash(hashed_password):
+        return _verify_legacy_password(plain_password, hashed_password)
     try:
-        salt, hash_value = hashed_password.split('$')
-        password_hash = hashlib.sha256((salt + plain_password).encode('utf-8')).hexdigest()
-        return password_hash == hash_value
-    except:
+        return pwd_context.verify(plain_password, hashed_password)
+    except ValueError:
         return False
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True for legacy records and bcrypt hashes made with another cost."""
+    return is_legacy_hash(hashed_password) or pwd_context.needs_update(hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     """
-    Hash a password with a random salt.
-    Format: salt$hash
+    Hash a password with bcrypt at the configured cost.
     """
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.sha256((salt + password).encode('utf-8')).hexdigest()
-    return f"{salt}${password_hash}"
+    return pwd_context.hash(password)
+
+
+class PasswordHasher:
+    """Runs hashing and verification on a bounded, dedicated thread pool."""
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rejected = 0
+        # Calls submitted and not finished yet; only touched on the event loop
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.workers)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-ins in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": min(self._in_flight, self.workers),
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+    def collect_metrics(self) -> List[Metric]:
+        stats = self.stats()
+        workers = Gauge("password_hash_workers", "Threads hashing passwords.")
+        workers.set(value=stats["workers"])
+        running = Gauge("password_hash_running", "Password hashes running now.")
+        running.set(value=stats["running"])
+        queued = Gauge("password_hash_queue_depth", "Password hashes waiting for a thread.")
+        queued.set(value=stats["queue_depth"])
+        rejected = Counter("password_hash_rejected_total", "Hashes turned away with 503 because the queue was full.")
+        rejected.set(value=stats["rejected"])
+        return [workers, running, queued, rejected]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_max_queue,
+)
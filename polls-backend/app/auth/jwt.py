@@ -1,3 +1,5 @@
+import hashlib
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,6 +8,18 @@ from app.config import settings
 SECRET_KEY = settings.jwt_secret
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.jwt_expires_min
+REFRESH_TOKEN_EXPIRE_DAYS = settings.refresh_expires_days
+REFRESH_SESSION_MAX_DAYS = settings.refresh_session_max_days
+
+
+def user_claims(user) -> dict:
+    """Claims identifying `user`, with the fields UserResponse needs."""
+    return {
+        "sub": str(user.id),
+        "email": user.email,
+        "name": user.name,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+    }
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -15,7 +29,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # jti lets a single token be revoked
+    to_encode.update({"exp": expire, "jti": secrets.token_hex(16)})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -27,3 +42,13 @@ def verify_token(token: str) -> Optional[dict]:
     except JWTError:
         return None
 
+
+def create_refresh_token() -> str:
+    """An opaque refresh token; store only its hash_refresh_token()."""
+    return secrets.token_urlsafe(32)
+
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are random, so a plain digest is enough to keep them
+    # unusable if the table leaks
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
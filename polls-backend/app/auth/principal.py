@@ -0,0 +1,94 @@
+"""
+Authenticated users built from access token claims.
+
+Tokens created from user_claims() carry every field of UserResponse, so
+once a token's signature and expiry check out no database read is needed.
+Verified tokens are also cached by their SHA-256, which skips decoding
+when a client presents the same token again.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.config import settings
+from app.schemas import UserResponse
+
+
+def principal_from_claims(payload: dict) -> Optional[UserResponse]:
+    """The user described by a verified token, or None for tokens without user claims."""
+    try:
+        return UserResponse(
+            id=int(payload["sub"]),
+            email=payload["email"],
+            name=payload["name"],
+            created_at=datetime.fromisoformat(payload["created_at"]),
+        )
+    except (KeyError, TypeError, ValueError, ValidationError):
+        return None
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens, keyed by token hash.
+
+    An entry lives for at most ttl_seconds and never past the token's own
+    expiry.
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[float, UserResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[UserResponse]:
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, user: UserResponse, expires_at: float) -> None:
+        """Cache `user` for `token`, which expires at the unix time `expires_at`."""
+        if self.capacity <= 0:
+            return
+        lifetime = min(self.ttl_seconds, expires_at - time.time())
+        if lifetime <= 0:
+            return
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + lifetime, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def evict(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(self.key(token), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    capacity=settings.auth_token_cache_size,
+    ttl_seconds=settings.auth_token_cache_ttl_seconds,
+)
@@ -1,32 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.db import get_db
-from app.schemas import UserCreate, UserResponse, LoginRequest, TokenResponse
-from app.auth.service import AuthService
-from app.auth.jwt import create_access_token
-from app.deps import get_current_user
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.security import HTTPAuthorizationCredentials
+from app.db import DBSession, get_db
+from app.schemas import UserCreate, UserResponse, LoginRequest, TokenResponse, RefreshRequest
+from app.auth.service import AsyncAuthService
+from app.auth.jwt import create_access_token, user_claims, verify_token
+from app.auth.principal import token_cache
+from app.deps import get_current_user, security
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    auth_service = AuthService(db)
-    user = auth_service.register_user(user_data)
+async def register(user_data: UserCreate, db: DBSession = Depends(get_db)):
+    auth_service = AsyncAuthService(db)
+    user = await auth_service.register_user(user_data)
     
-    access_token = create_access_token(data={"sub": str(user.id)})
-    return {"access_token": access_token, "token_type": "bearer"}
+    access_token = create_access_token(data=user_claims(user))
+    refresh_token = await auth_service.issue_refresh_token(user.id)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    auth_service = AuthService(db)
-    user = auth_service.authenticate_user(login_data)
+async def login(login_data: LoginRequest, db: DBSession = Depends(get_db)):
+    auth_service = AsyncAuthService(db)
+    user = await auth_service.authenticate_user(login_data)
     
-    access_token = create_access_token(data={"sub": str(user.id)})
-    return {"access_token": access_token, "token_type": "bearer"}
+    access_token = create_access_token(data=user_claims(user))
+    refresh_token = await auth_service.issue_refresh_token(user.id)
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh(refresh_data: RefreshRequest, db: DBSession = Depends(get_db)):
+    auth_service = AsyncAuthService(db)
+    user, refresh_token = await auth_service.rotate_refresh_token(refresh_data.refresh_token)
+    
+    access_token = create_access_token(data=user_claims(user))
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: UserResponse = Depends(get_current_user)):
+async def get_current_user_info(current_user: UserResponse = Depends(get_current_user)):
     return current_user
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    refresh_data: Optional[RefreshRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: DBSession = Depends(get_db)
+):
+    token = credentials.credentials
+    payload = verify_token(token)
+    if payload is None or payload.get("jti") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    auth_service = AsyncAuthService(db)
+    await auth_service.revoke_token(payload["jti"], datetime.fromtimestamp(payload["exp"], timezone.utc))
+    token_cache.evict(token)
+    if refresh_data is not None:
+        await auth_service.revoke_refresh_token(refresh_data.refresh_token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
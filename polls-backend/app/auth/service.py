@@ -1,17 +1,30 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from app.models import User
-from app.schemas import UserCreate, LoginRequest
-from app.auth.hashing import verify_password, get_password_hash
-from app.auth.jwt import create_access_token
+from sqlalchemy import case, delete, select, update
+from app.db import DBSession, run_sync
+from app.models import User, RevokedToken, RefreshToken
+from app.schemas import UserCreate, LoginRequest, UserResponse
+from app.auth.hashing import get_password_hash, password_needs_rehash, password_hasher
+from app.auth.jwt import (
+    create_access_token, create_refresh_token, hash_refresh_token, REFRESH_TOKEN_EXPIRE_DAYS,
+    REFRESH_SESSION_MAX_DAYS
+)
 from fastapi import HTTPException, status
 
 
+def invalid_credentials() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Incorrect email or password"
+    )
+
+
 class AuthService:
     def __init__(self, db: Session):
         self.db = db
     
-    def register_user(self, user_data: UserCreate) -> User:
+    def register_user(self, user_data: UserCreate, password_hash: Optional[str] = None) -> User:
         # Check if user already exists
         existing_user = self.db.execute(
             select(User).where(User.email == user_data.email)
@@ -23,12 +36,12 @@ class AuthService:
                 detail="Email already registered"
             )
         
-        # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        # Create new user; async callers hash the password on the password
+        # pool beforehand
         user = User(
             email=user_data.email,
             name=user_data.name,
-            password_hash=hashed_password
+            password_hash=password_hash or get_password_hash(user_data.password)
         )
         
         self.db.add(user)
@@ -36,18 +49,15 @@ class AuthService:
         self.db.refresh(user)
         return user
     
-    def authenticate_user(self, login_data: LoginRequest) -> User:
-        user = self.db.execute(
-            select(User).where(User.email == login_data.email)
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        return self.db.execute(
+            select(User).where(User.email == email)
         ).scalar_one_or_none()
-        
-        if not user or not verify_password(login_data.password, user.password_hash):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect email or password"
-            )
-        
-        return user
+    
+    def set_password_hash(self, user: User, password_hash: str) -> None:
+        user.password_hash = password_hash
+        self.db.commit()
+        self.db.refresh(user)
     
     def get_user_by_id(self, user_id: int) -> User:
         user = self.db.execute(
@@ -61,4 +71,128 @@ class AuthService:
             )
         
         return user
+    
+    def revoke_token(self, jti: str, expires_at: datetime) -> None:
+        # Revocations of tokens that have expired since are no longer needed
+        self.db.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at < datetime.now(timezone.utc))
+        )
+        self.db.merge(RevokedToken(jti=jti, expires_at=expires_at))
+        self.db.commit()
+    
+    def is_token_revoked(self, jti: Optional[str]) -> bool:
+        if jti is None:
+            return False
+        return self.db.get(RevokedToken, jti) is not None
+    
+    def issue_refresh_token(self, user_id: int) -> str:
+        now = datetime.now(timezone.utc)
+        # Clear out the user's expired tokens as new ones are issued
+        self.db.execute(
+            delete(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.expires_at < now)
+        )
+        token = create_refresh_token()
+        session_expires_at = now + timedelta(days=REFRESH_SESSION_MAX_DAYS)
+        self.db.add(RefreshToken(
+            user_id=user_id,
+            token_hash=hash_refresh_token(token),
+            expires_at=min(now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), session_expires_at),
+            session_expires_at=session_expires_at
+        ))
+        self.db.commit()
+        return token
+    
+    def rotate_refresh_token(self, refresh_token: str) -> Tuple[UserResponse, str]:
+        """
+        Exchange a refresh token for a new one and the user it belongs to.
+        
+        One indexed UPDATE swaps the stored hash and extends the expiry, so
+        the presented token stops working, and returns the user's fields
+        for the new access token. The expiry is never extended past the
+        session's, so a refresh token cannot be rotated forever.
+        """
+        now = datetime.now(timezone.utc)
+        token = create_refresh_token()
+        expires_at = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        user = self.db.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.token_hash == hash_refresh_token(refresh_token),
+                RefreshToken.expires_at > now,
+                RefreshToken.session_expires_at > now
+            )
+            .values(
+                token_hash=hash_refresh_token(token),
+                expires_at=case(
+                    (RefreshToken.session_expires_at < expires_at, RefreshToken.session_expires_at),
+                    else_=expires_at
+                )
+            )
+            .returning(
+                RefreshToken.user_id.label("id"),
+                *(
+                    select(column).where(User.id == RefreshToken.user_id).scalar_subquery().label(column.key)
+                    for column in (User.email, User.name, User.created_at)
+                )
+            )
+            .execution_options(synchronize_session=False)
+        ).one_or_none()
+        
+        if user is None:
+            self.db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid refresh token"
+            )
+        
+        self.db.commit()
+        return UserResponse.model_validate(user), token
+    
+    def revoke_refresh_token(self, refresh_token: str) -> None:
+        self.db.execute(
+            delete(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(refresh_token))
+        )
+        self.db.commit()
 
+
+class AsyncAuthService:
+    """Awaitable AuthService for async routes; see app.db.run_sync."""
+    
+    def __init__(self, db: DBSession):
+        self.db = db
+    
+    async def register_user(self, user_data: UserCreate) -> User:
+        password_hash = await password_hasher.hash(user_data.password)
+        return await run_sync(self.db, lambda session: AuthService(session).register_user(user_data, password_hash))
+    
+    async def authenticate_user(self, login_data: LoginRequest) -> User:
+        # Password checks run on the password pool, never on a database
+        # connection's thread
+        user = await run_sync(self.db, lambda session: AuthService(session).get_user_by_email(login_data.email))
+        
+        if not user or not await password_hasher.verify(login_data.password, user.password_hash):
+            raise invalid_credentials()
+        
+        if password_needs_rehash(user.password_hash):
+            password_hash = await password_hasher.hash(login_data.password)
+            await run_sync(self.db, lambda session: AuthService(session).set_password_hash(user, password_hash))
+        
+        return user
+    
+    async def get_user_by_id(self, user_id: int) -> User:
+        return await run_sync(self.db, lambda session: AuthService(session).get_user_by_id(user_id))
+    
+    async def revoke_token(self, jti: str, expires_at: datetime) -> None:
+        return await run_sync(self.db, lambda session: AuthService(session).revoke_token(jti, expires_at))
+    
+    async def is_token_revoked(self, jti: Optional[str]) -> bool:
+        return await run_sync(self.db, lambda session: AuthService(session).is_token_revoked(jti))
+    
+    async def issue_refresh_token(self, user_id: int) -> str:
+        return await run_sync(self.db, lambda session: AuthService(session).issue_refresh_token(user_id))
+    
+    async def rotate_refresh_token(self, refresh_token: str) -> Tuple[UserResponse, str]:
+        return await run_sync(self.db, lambda session: AuthService(session).rotate_refresh_token(refresh_token))
+    
+    async def revoke_refresh_token(self, refresh_token: str) -> None:
+        return await run_sync(self.db, lambda session: AuthService(session).revoke_refresh_token(refresh_token))
@@ -6,10 +6,99 @@ import os
 
 class Settings(BaseSettings):
     database_url: str = "sqlite:///./test.db"
+    # Serve requests through an async engine (asyncpg / aiosqlite) instead of
+    # running the sync engine in the threadpool
+    db_async: bool = False
+    # Connection pool, per worker (and per engine with DB_ASYNC). Size it so
+    # workers * (db_pool_size + db_max_overflow) fits the server's limit
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # Seconds a request waits for a free connection before failing
+    db_pool_timeout_seconds: float = 30.0
+    # Replace connections older than this, before the server or a proxy
+    # drops them as idle (-1 never recycles)
+    db_pool_recycle_seconds: int = 1800
+    # Test every connection on checkout; costs a round trip per checkout and
+    # is mostly redundant with a recycle below the idle timeout
+    db_pool_pre_ping: bool = True
+    # Server-side statement timeout on PostgreSQL (0 disables it)
+    db_statement_timeout_ms: int = 0
     jwt_secret: str = "your-super-secret-jwt-key-change-this-in-production"
     jwt_expires_min: int = 15
     refresh_expires_days: int = 7
+    # Absolute lifetime of a sign-in; refreshing cannot keep it alive longer
+    refresh_session_max_days: int = 30
+    # Build the authenticated user from the access token's claims instead of
+    # loading it on every request; verified tokens are cached by their hash
+    jwt_principal_claims: bool = True
+    auth_token_cache_size: int = 4096
+    auth_token_cache_ttl_seconds: float = 60.0
+    # Reject access tokens revoked by /auth/logout. Checked when a worker
+    # first sees a token, so a revocation takes effect within the cache TTL
+    auth_revocation_check: bool = False
+    # bcrypt cost (log2 of the rounds); existing hashes are upgraded to a
+    # new cost on the next login
+    password_bcrypt_rounds: int = 12
+    # Hashes run on this many dedicated threads; sign-ins beyond
+    # password_hash_max_queue waiting ones get 503
+    password_hash_workers: int = 2
+    password_hash_max_queue: int = 64
     allowed_origins: Union[List[str], str] = ["http://localhost:3000", "http://localhost:5173"]
+    # In-process poll results cache; entries are kept fresh by this worker's
+    # votes, so the TTL bounds staleness from votes handled by other workers
+    results_cache_size: int = 1024
+    results_cache_ttl_seconds: float = 5.0
+    # How long a shared cache (reverse proxy) may serve anonymous poll
+    # results before revalidating them with their ETag
+    results_shared_max_age_seconds: int = 1
+    # Encode poll listings and results with orjson straight from the
+    # service's models, skipping FastAPI's response_model re-validation
+    fast_json_responses: bool = False
+    # WebSocket fan-out: messages buffered per connection before new ones
+    # are skipped, and how long a single send may take before the
+    # connection is dropped
+    ws_queue_size: int = 32
+    ws_send_timeout_seconds: float = 5.0
+    # Coalesce poll updates into at most one snapshot per poll per interval
+    # (0 sends every vote as its own message)
+    ws_coalesce_interval_ms: int = 0
+    ws_coalesce_max_polls: int = 10000
+    # How updates reach the sockets of every worker: "local" (single worker)
+    # or "postgres" (LISTEN/NOTIFY on ws_broadcast_channel)
+    ws_broadcast_backend: str = "local"
+    ws_broadcast_channel: str = "poll_updates"
+    # Polls one /ws connection may subscribe to
+    ws_max_subscriptions: int = 200
+    # Updates kept per poll, for the most recently updated polls, so that
+    # reconnecting clients get what they missed instead of a snapshot
+    ws_history_size: int = 256
+    ws_history_max_polls: int = 1000
+    # Every interval each connection is sent a ping; one that has sent
+    # nothing (a pong or any other message) for ws_idle_timeout_seconds is
+    # closed. 0 disables the heartbeat and the idle check
+    ws_heartbeat_interval_seconds: float = 20.0
+    ws_idle_timeout_seconds: float = 60.0
+    # Connections accepted per worker and per poll; beyond that new ones
+    # are refused with close code 1013 (try again later)
+    ws_max_connections: int = 10000
+    ws_max_connections_per_poll: int = 5000
+    # Votes leave their update in the outbox table; the dispatcher publishes
+    # up to outbox_batch_size per transaction, woken by votes on this worker
+    # and otherwise every outbox_poll_interval_seconds
+    outbox_batch_size: int = 100
+    outbox_poll_interval_seconds: float = 1.0
+    # Write-behind voting: votes are answered with 202 once buffered and
+    # written in batches every vote_buffer_flush_interval_ms or as soon as
+    # vote_buffer_flush_size are pending. Buffered votes survive a clean
+    # shutdown but not a crash, so the interval bounds what can be lost
+    vote_write_behind: bool = False
+    vote_buffer_flush_interval_ms: int = 100
+    vote_buffer_flush_size: int = 1000
+    # Votes held before new ones are answered with 503
+    vote_buffer_max_pending: int = 100000
+    # Shared key of trusted ingesters for POST /polls/votes:batch, sent as
+    # X-Ingest-Key (empty disables the endpoint)
+    vote_ingest_key: str = ""
     
     @field_validator('allowed_origins', mode='before')
     @classmethod
@@ -1,23 +1,181 @@
+import threading
+import time
+from typing import Callable, List, TypeVar, Union
 from sqlalchemy import create_engine
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 from app.config import settings
+from app.metrics import Counter, Gauge, Histogram, HistogramMetric, Metric
+
+T = TypeVar("T")
+
+# What get_db yields: an AsyncSession when DB_ASYNC is set, a Session otherwise
+DBSession = Union[Session, AsyncSession]
 
 # Ensure SSL mode for Azure PostgreSQL
 DATABASE_URL = settings.database_url
 if DATABASE_URL and "sslmode" not in DATABASE_URL:
     DATABASE_URL += ("&" if "?" in DATABASE_URL else "?") + "sslmode=require"
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Seconds spent obtaining a connection from the pool
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.timeouts = 0
+        self.wait_seconds = Histogram(POOL_WAIT_BUCKETS)
+        self._lock = threading.Lock()
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+
+class InstrumentedPoolMixin:
+    """
+    Times every checkout from the pool.
+
+    The wait covers queueing for a free connection and, below the pool
+    limit, opening a new one. Every pool has its own metrics.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; the counters carry over
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa_exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.wait_seconds.observe(time.perf_counter() - started)
+        return connection
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str) -> dict:
+    """create_engine / create_async_engine arguments from the DB_POOL_* settings."""
+    url = make_url(url)
+    options = {"pool_pre_ping": settings.db_pool_pre_ping}
+
+    # Only queue pools are sized; SQLite in-memory and aiosqlite databases
+    # keep their dialect's default pool
+    default_pool = url.get_dialect().get_pool_class(url)
+    if issubclass(default_pool, QueuePool):
+        async_pool = issubclass(default_pool, AsyncAdaptedQueuePool)
+        options.update(
+            poolclass=InstrumentedAsyncAdaptedQueuePool if async_pool else InstrumentedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+            pool_recycle=settings.db_pool_recycle_seconds,
+        )
+
+    if url.get_backend_name() == "postgresql" and settings.db_statement_timeout_ms > 0:
+        timeout = str(settings.db_statement_timeout_ms)
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 Base = declarative_base()
 
 
-def get_db():
+def async_database_url(url: str) -> str:
+    """Map a sync database URL onto its async driver (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        query = dict(url.query)
+        # asyncpg takes `ssl` instead of libpq's `sslmode`
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+    if url.get_backend_name() == "sqlite":
+        query = {key: value for key, value in url.query.items() if key != "sslmode"}
+        return url.set(drivername="sqlite+aiosqlite", query=query).render_as_string(hide_password=False)
+    return url.render_as_string(hide_password=False)
+
+
+async_engine = None
+AsyncSessionLocal = None
+if settings.db_async:
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL), **engine_options(async_database_url(DATABASE_URL))
+    )
+    # Objects returned by services are read after the session committed,
+    # outside the greenlet, so they must not expire and lazy-load
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+def collect_pool_metrics() -> List[Metric]:
+    in_use = Gauge("db_pool_connections_in_use", "Connections checked out of the pool.", ("engine",))
+    idle = Gauge("db_pool_connections_idle", "Open connections waiting in the pool.", ("engine",))
+    overflow = Gauge("db_pool_overflow_in_use", "Connections open beyond the pool size.", ("engine",))
+    checkouts = Counter("db_pool_checkouts_total", "Connections handed out by the pool.", ("engine",))
+    timeouts = Counter("db_pool_timeouts_total", "Checkouts that timed out waiting for a connection.", ("engine",))
+    wait = HistogramMetric("db_pool_wait_seconds", "Time to obtain a connection from the pool.", ("engine",))
+
+    engines = {"sync": engine.pool}
+    if async_engine is not None:
+        engines["async"] = async_engine.sync_engine.pool
+    for name, pool in engines.items():
+        if not isinstance(pool, InstrumentedPoolMixin):
+            continue
+        in_use.set(name, value=pool.checkedout())
+        idle.set(name, value=pool.checkedin())
+        overflow.set(name, value=max(0, pool.overflow()))
+        checkouts.set(name, value=pool.metrics.wait_seconds.count)
+        timeouts.set(name, value=pool.metrics.timeouts)
+        wait.attach(name, histogram=pool.metrics.wait_seconds)
+    return [in_use, idle, overflow, checkouts, timeouts, wait]
+
+
+async def get_db():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
+
+
+async def run_sync(db: DBSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run fn(session, *args, **kwargs) without blocking the event loop.
 
+    Async sessions run the sync code on the async driver through
+    AsyncSession.run_sync; plain sessions run it in the threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
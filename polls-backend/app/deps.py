@@ -1,10 +1,10 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.db import get_db
-from app.models import User
+from app.config import settings
+from app.db import DBSession, get_db
 from app.auth.jwt import verify_token
-from app.auth.service import AuthService
+from app.auth.principal import principal_from_claims, token_cache
+from app.auth.service import AsyncAuthService
 from app.schemas import UserResponse
 from typing import Optional
 
@@ -12,11 +12,20 @@ security = HTTPBearer()
 optional_security = HTTPBearer(auto_error=False)
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> UserResponse:
-    token = credentials.credentials
+async def authenticate(token: str, db: DBSession) -> UserResponse:
+    """
+    The user a bearer token belongs to.
+    
+    With JWT_PRINCIPAL_CLAIMS the user comes from the token itself (or the
+    token cache) and the database is only read for tokens issued without
+    user claims, or when AUTH_REVOCATION_CHECK is on and the token is new
+    to this worker.
+    """
+    if settings.jwt_principal_claims:
+        user = token_cache.get(token)
+        if user is not None:
+            return user
+    
     payload = verify_token(token)
     
     if payload is None:
@@ -34,32 +43,38 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    auth_service = AuthService(db)
-    user = auth_service.get_user_by_id(int(user_id))
-    return user
+    auth_service = AsyncAuthService(db)
+    if settings.auth_revocation_check and await auth_service.is_token_revoked(payload.get("jti")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    if settings.jwt_principal_claims:
+        user = principal_from_claims(payload)
+        if user is not None:
+            token_cache.put(token, user, payload["exp"])
+            return user
+    
+    return await auth_service.get_user_by_id(int(user_id))
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: DBSession = Depends(get_db)
+) -> UserResponse:
+    return await authenticate(credentials.credentials, db)
 
 
-def get_current_user_optional(
+async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_db)
 ) -> Optional[UserResponse]:
     if credentials is None:
         return None
     
-    token = credentials.credentials
-    payload = verify_token(token)
-    
-    if payload is None:
-        return None
-    
-    user_id = payload.get("sub")
-    if user_id is None:
-        return None
-    
-    auth_service = AuthService(db)
     try:
-        user = auth_service.get_user_by_id(int(user_id))
-        return user
-    except:
+        return await authenticate(credentials.credentials, db)
+    except HTTPException:
         return None
-
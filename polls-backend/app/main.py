@@ -1,15 +1,41 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
+from app.db import collect_pool_metrics
+from app.metrics import MetricsMiddleware, registry
+from app.auth.hashing import password_hasher
 from app.auth.routes import router as auth_router
-from app.polls.routes import router as polls_router
+from app.polls.routes import router as polls_router, ws_router
+from app.polls.buffer import vote_buffer
+from app.polls.cache import results_cache
+from app.polls.outbox import outbox_dispatcher
+from app.polls.ws import manager
+from app.polls.pagination import NEXT_CURSOR_HEADER
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    await outbox_dispatcher.start()
+    if settings.vote_write_behind:
+        await vote_buffer.start()
+    yield
+    # Flushes the votes still buffered
+    await vote_buffer.stop()
+    await outbox_dispatcher.stop()
+    await manager.stop()
+    password_hasher.shutdown()
+
 
 app = FastAPI(
     title="Polls Voting API",
     description="A real-time polls voting application API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -19,11 +45,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Outermost, so every request is measured
+app.add_middleware(MetricsMiddleware)
+
+registry.add_collector(collect_pool_metrics)
+registry.add_collector(manager.collect_metrics)
+registry.add_collector(outbox_dispatcher.collect_metrics)
+registry.add_collector(vote_buffer.collect_metrics)
+registry.add_collector(results_cache.collect_metrics)
+registry.add_collector(password_hasher.collect_metrics)
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(polls_router)
+app.include_router(ws_router)
 
 
 @app.get("/")
@@ -35,3 +73,7 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,261 @@
+"""
+In-process metrics, rendered in the Prometheus text format by GET /metrics.
+
+Besides the HTTP middleware and the SQL hooks defined here, collectors
+registered with `registry.add_collector` contribute metrics computed at
+scrape time (connection pools, WebSockets).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Histogram:
+    """
+    Observation counts per upper bound, cumulative like Prometheus buckets.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket plus +Inf
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + (float("inf"),), self._counts):
+                cumulative += count
+                buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+            return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """A named metric with one value (or histogram) per combination of labels."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            lines.extend(self._render_sample(dict(zip(self.labelnames, labelvalues)), value))
+        return lines
+
+    def _render_sample(self, labels: Dict[str, str], value) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def set(self, *labelvalues, value: float) -> None:
+        """For collectors mirroring a counter kept elsewhere."""
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, *labelvalues, value: float) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class HistogramMetric(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, *labelvalues, value: float) -> None:
+        with self._lock:
+            histogram = self._values.get(labelvalues)
+            if histogram is None:
+                histogram = self._values[labelvalues] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def attach(self, *labelvalues, histogram: Histogram) -> None:
+        """For collectors exposing a Histogram kept elsewhere."""
+        with self._lock:
+            self._values[labelvalues] = histogram
+
+    def _render_sample(self, labels: Dict[str, str], histogram: Histogram) -> List[str]:
+        snapshot = histogram.snapshot()
+        lines = [
+            f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {count}"
+            for bound, count in snapshot["buckets"].items()
+        ]
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(snapshot['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {snapshot['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect: Callable[[], Iterable[Metric]]) -> None:
+        """Register a function building metrics at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for metric in collect():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")
+))
+http_request_duration = registry.register(HistogramMetric(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being handled."
+))
+http_request_sql_statements = registry.register(HistogramMetric(
+    "http_request_sql_statements", "SQL statements issued per HTTP request, by route.",
+    ("method", "route"), buckets=SQL_STATEMENT_BUCKETS
+))
+http_request_sql_duration = registry.register(HistogramMetric(
+    "http_request_sql_seconds", "Time spent in SQL per HTTP request, by route.", ("method", "route")
+))
+sql_statements = registry.register(Counter(
+    "sql_statements_total", "SQL statements issued, inside requests or not."
+))
+sql_duration = registry.register(Counter(
+    "sql_seconds_total", "Time spent in SQL statements."
+))
+
+
+class RequestQueries:
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+# The current request's accumulator. The threadpool and AsyncSession.run_sync
+# both run with a copy of the request's context, so they see the same object
+_request_queries: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    sql_statements.inc()
+    sql_duration.inc(amount=elapsed)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.statements += 1
+        queries.seconds += elapsed
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status, in-flight count and SQL usage of HTTP requests.
+
+    Requests are labelled with their route template (`/polls/{poll_id}`),
+    so label cardinality stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        queries = RequestQueries()
+        token = _request_queries.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            _request_queries.reset(token)
+
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            http_requests.inc(*labels, str(status))
+            http_request_duration.observe(*labels, value=elapsed)
+            http_request_sql_statements.observe(*labels, value=queries.statements)
+            http_request_sql_duration.observe(*labels, value=queries.seconds)
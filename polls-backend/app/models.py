@@ -26,18 +26,29 @@ class Poll(Base):
     description = Column(Text, nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Denormalized counter, maintained alongside every vote insert/change
+    total_votes = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bumped by every vote that changes the results; backs their ETag
+    results_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     owner = relationship("User", back_populates="polls")
     options = relationship("Option", back_populates="poll", cascade="all, delete-orphan")
 
 
+# Keyset pagination order of GET /polls/ and /polls/me
+Index("ix_polls_created_at_id", Poll.created_at.desc(), Poll.id.desc())
+Index("ix_polls_owner_id_created_at_id", Poll.owner_id, Poll.created_at.desc(), Poll.id.desc())
+
+
 class Option(Base):
     __tablename__ = "options"
     
     id = Column(Integer, primary_key=True, index=True)
     poll_id = Column(Integer, ForeignKey("polls.id"), nullable=False, index=True)
     text = Column(String(500), nullable=False)
+    # Denormalized counter, maintained alongside every vote insert/change
+    votes_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     poll = relationship("Poll", back_populates="options")
@@ -46,15 +57,52 @@ class Option(Base):
 
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        # One vote per user per poll, enforced by the database
+        UniqueConstraint("user_id", "poll_id", name="uq_votes_user_poll"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    poll_id = Column(Integer, ForeignKey("polls.id"), nullable=False, index=True)
     option_id = Column(Integer, ForeignKey("options.id"), nullable=False, index=True)
+    # Option the vote was moved away from by its last upsert (NULL for a fresh vote)
+    previous_option_id = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="votes")
     option = relationship("Option", back_populates="votes")
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    
+    # `jti` claim of a revoked access token
+    jti = Column(String(64), primary_key=True)
+    # When the token would have expired anyway; the row can go after that
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
     
-    # Note: Unique constraint for one vote per user per poll will be handled
-    # by application logic since we need to join with options to get poll_id
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # SHA-256 of the token; only the client holds the token itself. Each
+    # refresh rotates the hash in place
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    # Fixed at sign-in; rotations never extend expires_at past it
+    session_expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+    
+    # Published in id order, then deleted
+    id = Column(Integer, primary_key=True)
+    # PollUpdateMessage JSON, written in the transaction of the vote
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
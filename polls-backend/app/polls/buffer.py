@@ -0,0 +1,128 @@
+"""
+Write-behind vote buffer (VOTE_WRITE_BEHIND).
+
+Accepted votes are held in memory, one per user and poll, a later vote
+replacing the earlier one, and written with PollsService.cast_votes every
+flush interval or as soon as flush_size votes are pending. A live poll
+taking thousands of votes per second then costs one transaction per
+flush instead of one per vote. The app flushes the buffer on shutdown;
+votes still buffered when the process dies are lost.
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import settings
+from app.db import SessionLocal, run_sync
+from app.metrics import Counter, Gauge, Metric
+from app.polls.outbox import outbox_dispatcher
+from app.polls.service import PollsService, VoteBatch
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    def __init__(
+        self,
+        session_factory: sessionmaker = SessionLocal,
+        flush_interval: float = settings.vote_buffer_flush_interval_ms / 1000,
+        flush_size: int = settings.vote_buffer_flush_size,
+        max_pending: int = settings.vote_buffer_max_pending,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+        self._pending: VoteBatch = {}
+        self._wakeup = asyncio.Event()
+        # Flushes run one at a time, so a user's later vote is never
+        # overwritten by an earlier one still being written
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, votes: VoteBatch) -> None:
+        """Buffer votes, or reject them all with 503 if they do not fit."""
+        new = sum(1 for key in votes if key not in self._pending)
+        if len(self._pending) + new > self.max_pending:
+            self.rejected += len(votes)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many votes waiting to be saved, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._pending.update(votes)
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("Flushing buffered votes failed")
+
+    async def flush(self) -> int:
+        """Write every pending vote; returns how many were valid."""
+        async with self._flush_lock:
+            votes, self._pending = self._pending, {}
+            if not votes:
+                return 0
+            session = self.session_factory()
+            try:
+                cast = await run_sync(session, lambda session: PollsService(session).cast_votes(votes))
+            except Exception:
+                # Keep the votes for the next flush, unless their users
+                # voted again in the meantime
+                for key, option_id in votes.items():
+                    self._pending.setdefault(key, option_id)
+                raise
+            finally:
+                await run_sync(session, Session.close)
+            self.flushed += len(votes)
+            outbox_dispatcher.notify()
+            return cast
+
+    def collect_metrics(self) -> List[Metric]:
+        pending = Gauge("vote_buffer_pending", "Votes waiting in the write-behind buffer.")
+        pending.set(value=len(self._pending))
+        flushed = Counter("vote_buffer_flushed_total", "Buffered votes written to the database.")
+        flushed.set(value=self.flushed)
+        failed = Counter("vote_buffer_failed_flushes_total", "Flushes that failed; their votes are retried.")
+        failed.set(value=self.failed_flushes)
+        rejected = Counter("vote_buffer_rejected_total", "Votes rejected because the buffer was full.")
+        rejected.set(value=self.rejected)
+        return [pending, flushed, failed, rejected]
+
+
+vote_buffer = VoteBuffer()
@@ -0,0 +1,127 @@
+"""
+Pub/sub backends behind ConnectionManager.broadcast_to_poll.
+
+Every worker subscribes its ConnectionManager to the bus and only fans
+out to its own sockets; a vote published by any worker reaches them all.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+
+from sqlalchemy.engine import make_url
+
+from app.config import settings
+from app.db import DATABASE_URL
+from app.schemas import PollUpdateMessage
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastBus(ABC):
+    def __init__(self):
+        self._subscribers: List[Callable[[PollUpdateMessage], None]] = []
+
+    def subscribe(self, deliver: Callable[[PollUpdateMessage], None]):
+        self._subscribers.append(deliver)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, message: PollUpdateMessage):
+        ...
+
+    def _dispatch(self, message: PollUpdateMessage):
+        for deliver in self._subscribers:
+            deliver(message)
+
+
+class LocalBus(BroadcastBus):
+    """
+    Delivers to the subscribers in this process.
+
+    Enough for a single worker; in tests, several managers subscribed to
+    one LocalBus behave like workers sharing a broker.
+    """
+
+    async def publish(self, message: PollUpdateMessage):
+        self._dispatch(message)
+
+
+class PostgresBus(BroadcastBus):
+    """Fans messages out to every worker through PostgreSQL LISTEN/NOTIFY."""
+
+    def __init__(self, dsn: str, channel: str, reconnect_delay: float = 1.0):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._listener = None
+        self._publisher = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        import asyncpg
+
+        self._stopping = False
+        # A pool, since one asyncpg connection cannot run concurrent publishes
+        self._publisher = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        await self._listen()
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._listener is not None:
+            await self._listener.close()
+        if self._publisher is not None:
+            await self._publisher.close()
+
+    async def publish(self, message: PollUpdateMessage):
+        await self._publisher.execute("SELECT pg_notify($1, $2)", self.channel, message.model_dump_json())
+
+    async def _listen(self):
+        import asyncpg
+
+        self._listener = await asyncpg.connect(self.dsn)
+        self._listener.add_termination_listener(self._on_terminated)
+        await self._listener.add_listener(self.channel, self._on_notify)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        try:
+            message = PollUpdateMessage.model_validate_json(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed notification on %s: %r", channel, payload)
+            return
+        self._dispatch(message)
+
+    def _on_terminated(self, connection):
+        if not self._stopping:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        # Updates published while disconnected are lost for this worker's
+        # viewers; they catch up on the next update of each poll
+        while not self._stopping:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self._listen()
+                return
+            except Exception:
+                logger.exception("Reconnecting the broadcast listener failed")
+
+
+def postgres_dsn(url: str) -> str:
+    """A libpq-style DSN for asyncpg from a SQLAlchemy database URL."""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def create_bus() -> BroadcastBus:
+    if settings.ws_broadcast_backend == "postgres":
+        return PostgresBus(postgres_dsn(DATABASE_URL), settings.ws_broadcast_channel)
+    return LocalBus()
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.metrics import Counter, Gauge, Metric
+
+
+@dataclass(frozen=True)
+class PollAggregate:
+    """The part of a poll's results that is the same for every viewer."""
+    id: int
+    title: str
+    description: str
+    owner_id: int
+    created_at: datetime
+    # (option_id, text, votes_count) in option id order
+    options: Tuple[Tuple[int, str, int], ...]
+    total_votes: int
+    # polls.results_version the entry reflects
+    results_version: int = 0
+
+
+class ResultsCache:
+    """
+    Bounded LRU/TTL cache of poll aggregates keyed by poll id.
+
+    Votes update cached entries in place by applying their deltas. An entry
+    only takes the vote that directly follows its results_version, so it
+    always matches the version it is labelled with; a vote arriving out of
+    order, or after votes this worker did not see, drops it. Each poll has a
+    version that is bumped by every write; a fill is only stored if the
+    version it read before going to the database is still current and no
+    write is in flight, so a fill can never overwrite a fresher entry.
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[int, Tuple[float, PollAggregate]]" = OrderedDict()
+        self._versions: "OrderedDict[int, int]" = OrderedDict()
+        self._version_floor = 0
+        self._clock = 0
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, poll_id: int) -> Optional[PollAggregate]:
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(poll_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[poll_id]
+            self.misses += 1
+            return None
+
+    def version(self, poll_id: int) -> int:
+        with self._lock:
+            return self._versions.get(poll_id, self._version_floor)
+
+    def put(self, poll_id: int, aggregate: PollAggregate, version: int) -> bool:
+        """Store a fill read at `version`; returns False if it went stale."""
+        if self.capacity <= 0:
+            return False
+        with self._lock:
+            if self._pending.get(poll_id) or self._versions.get(poll_id, self._version_floor) != version:
+                return False
+            self._entries[poll_id] = (time.monotonic(), aggregate)
+            self._entries.move_to_end(poll_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def begin_write(self, poll_id: int) -> None:
+        """Block fills for a poll until the matching end_write."""
+        with self._lock:
+            self._pending[poll_id] = self._pending.get(poll_id, 0) + 1
+
+    def end_write(self, poll_id: int) -> None:
+        with self._lock:
+            remaining = self._pending.get(poll_id, 1) - 1
+            if remaining:
+                self._pending[poll_id] = remaining
+            else:
+                self._pending.pop(poll_id, None)
+            self._bump_version(poll_id)
+
+    def apply_vote(
+        self, poll_id: int, option_id: int, previous_option_id: Optional[int], results_version: Optional[int] = None
+    ) -> None:
+        """
+        Apply a committed vote, which moved the poll to results_version, to
+        the cached entry, if any. A new vote takes one version, a moved vote
+        two, one per option.
+        """
+        if previous_option_id == option_id:
+            return
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is None:
+                return
+            cached_at, aggregate = entry
+            step = 1 if previous_option_id is None else 2
+            if results_version is not None and results_version != aggregate.results_version + step:
+                del self._entries[poll_id]
+                return
+            deltas = {option_id: 1}
+            if previous_option_id is not None:
+                deltas[previous_option_id] = -1
+            options = tuple(
+                (id, text, votes_count + deltas.get(id, 0))
+                for id, text, votes_count in aggregate.options
+            )
+            total_votes = aggregate.total_votes + (1 if previous_option_id is None else 0)
+            self._entries[poll_id] = (cached_at, replace(
+                aggregate,
+                options=options,
+                total_votes=total_votes,
+                results_version=aggregate.results_version if results_version is None else results_version
+            ))
+
+    def invalidate(self, poll_id: int) -> None:
+        with self._lock:
+            self._entries.pop(poll_id, None)
+            self._bump_version(poll_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            for poll_id in list(self._entries):
+                self._bump_version(poll_id)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def collect_metrics(self) -> List[Metric]:
+        stats = self.stats()
+        size = Gauge("results_cache_entries", "Poll aggregates held in the results cache.")
+        size.set(value=stats["size"])
+        capacity = Gauge("results_cache_capacity", "Poll aggregates the results cache holds at most.")
+        capacity.set(value=stats["capacity"])
+        hits = Counter("results_cache_hits_total", "Results served from the cache.")
+        hits.set(value=stats["hits"])
+        misses = Counter("results_cache_misses_total", "Results read from the database.")
+        misses.set(value=stats["misses"])
+        evictions = Counter("results_cache_evictions_total", "Entries evicted to stay within capacity.")
+        evictions.set(value=stats["evictions"])
+        return [size, capacity, hits, misses, evictions]
+
+    def _bump_version(self, poll_id: int) -> None:
+        # Versions come from one clock, so a version record dropped to keep
+        # the table bounded is covered by the floor and never reused
+        self._clock += 1
+        self._versions[poll_id] = self._clock
+        self._versions.move_to_end(poll_id)
+        while len(self._versions) > max(self.capacity, 1) * 4:
+            _, dropped = self._versions.popitem(last=False)
+            self._version_floor = max(self._version_floor, dropped)
+
+
+results_cache = ResultsCache(
+    capacity=settings.results_cache_size,
+    ttl_seconds=settings.results_cache_ttl_seconds,
+)
@@ -0,0 +1,38 @@
+"""
+Conditional GETs for poll results.
+
+The ETag is built from polls.results_version, so whether a client's copy
+is current takes one primary key lookup; a 304 skips reading the
+aggregate and serializing it.
+"""
+from typing import Dict, Optional
+
+from app.config import settings
+
+
+def results_etag(results_version: int, user_id: Optional[int]) -> str:
+    # The body carries the viewer's own vote, so each viewer has its own tag
+    return f'"r{results_version}-u{user_id or 0}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def results_cache_headers(results_version: int, user_id: Optional[int]) -> Dict[str, str]:
+    if user_id is None:
+        # Anonymous results are the same for everyone: a shared cache may
+        # keep them briefly, browsers revalidate every time
+        cache_control = f"public, max-age=0, s-maxage={settings.results_shared_max_age_seconds}"
+    else:
+        cache_control = "private, no-cache"
+    return {
+        "ETag": results_etag(results_version, user_id),
+        "Cache-Control": cache_control,
+        "Vary": "Authorization",
+    }
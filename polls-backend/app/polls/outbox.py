@@ -0,0 +1,126 @@
+"""
+Transactional outbox for poll updates.
+
+A vote writes its PollUpdateMessage to the outbox table in the vote's own
+transaction, so the request returns right after the commit. The
+OutboxDispatcher drains the table in the background and publishes the
+messages in id order. A row is only deleted in the transaction that read
+it, after its message was published, so updates committed before a crash
+or restart are published once the app is back; a message may then go out
+twice, which viewers absorb since every message carries absolute counts.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import settings
+from app.db import SessionLocal, run_sync
+from app.metrics import Counter, Metric
+from app.models import OutboxMessage
+from app.polls.ws import manager
+from app.schemas import PollUpdateMessage
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_xact_lock key held while draining; one worker drains at a
+# time, which keeps messages in commit order across workers
+OUTBOX_LOCK_KEY = 0x706F6C6C
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        publish: Callable[[PollUpdateMessage], Awaitable[None]],
+        session_factory: sessionmaker = SessionLocal,
+        batch_size: int = settings.outbox_batch_size,
+        poll_interval: float = settings.outbox_poll_interval_seconds,
+    ):
+        self.publish = publish
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.published = 0
+        self.failed_drains = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        """Wake the dispatcher after committing a message."""
+        self._wakeup.set()
+
+    async def start(self):
+        # A fresh event, bound to the loop the app now runs on
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                # Messages left by other workers or before a restart
+                pass
+            self._wakeup.clear()
+            try:
+                while await self.drain() == self.batch_size:
+                    pass
+            except Exception:
+                self.failed_drains += 1
+                logger.exception("Publishing the outbox failed")
+
+    async def drain(self) -> int:
+        """Publish and delete one batch of messages; returns how many."""
+        session = self.session_factory()
+        try:
+            messages = await run_sync(session, self._claim)
+            for _, payload in messages:
+                await self.publish(PollUpdateMessage.model_validate_json(payload))
+            if messages:
+                await run_sync(session, self._delete, [id for id, _ in messages])
+                self.published += len(messages)
+            return len(messages)
+        finally:
+            # Rolls back, releasing the lock, if publishing failed
+            await run_sync(session, Session.close)
+
+    def _claim(self, session: Session) -> List[Tuple[int, str]]:
+        if session.get_bind().dialect.name == "postgresql":
+            locked = session.execute(select(func.pg_try_advisory_xact_lock(OUTBOX_LOCK_KEY))).scalar()
+            if not locked:
+                return []
+        return session.execute(
+            select(OutboxMessage.id, OutboxMessage.payload)
+            .order_by(OutboxMessage.id)
+            .limit(self.batch_size)
+        ).all()
+
+    def _delete(self, session: Session, ids: List[int]):
+        session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(ids)))
+        session.commit()
+
+    def collect_metrics(self) -> List[Metric]:
+        published = Counter("outbox_published_total", "Poll updates published from the outbox.")
+        published.set(value=self.published)
+        failed = Counter("outbox_failed_drains_total", "Outbox drains that failed and will be retried.")
+        failed.set(value=self.failed_drains)
+        return [published, failed]
+
+
+async def publish_update(message: PollUpdateMessage):
+    await manager.broadcast_to_poll(message.poll_id, message)
+
+
+outbox_dispatcher = OutboxDispatcher(publish_update)
@@ -0,0 +1,67 @@
+"""
+Opaque keyset cursors for poll listings ordered by (created_at DESC, id DESC).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, tuple_
+
+from app.models import Poll
+from app.schemas import PollListResponse
+
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, poll_id: int) -> str:
+    raw = json.dumps({"c": created_at.isoformat(), "i": poll_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["c"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def next_cursor(page: List[PollListResponse], limit: int) -> Optional[str]:
+    """Cursor for the page after `page`, or None when it was the last one."""
+    if len(page) < limit:
+        return None
+    return encode_cursor(page[-1].created_at, page[-1].id)
+
+
+def created_at_key(dialect: str):
+    """
+    The created_at expression pages are ordered and seeked by.
+
+    SQLite stores timestamps as text, with or without microseconds, so
+    there they are ordered and compared as numbers; sorting by the text
+    while seeking by the number could skip or repeat polls.
+    """
+    if dialect == "sqlite":
+        return func.julianday(Poll.created_at)
+    return Poll.created_at
+
+
+def order_by(dialect: str):
+    """ORDER BY clauses of a poll listing, newest first."""
+    return created_at_key(dialect).desc(), Poll.id.desc()
+
+
+def after_cursor(cursor: str, dialect: str):
+    """WHERE clause selecting the polls that sort after the cursor."""
+    created_at, poll_id = decode_cursor(cursor)
+    value = func.julianday(created_at) if dialect == "sqlite" else created_at
+
+    # Row-value comparison, so PostgreSQL can seek the (created_at, id) index
+    return tuple_(created_at_key(dialect), Poll.id) < tuple_(value, poll_id)
@@ -0,0 +1,122 @@
+"""
+Recompute the denormalized vote counters from the votes table.
+
+Usage:
+    python -m app.polls.reconcile          # report drift only
+    python -m app.polls.reconcile --fix    # report and repair drift
+"""
+import argparse
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+
+from app.models import Poll, Option, Vote
+from app.polls.cache import ResultsCache, results_cache
+
+
+@dataclass
+class CounterDrift:
+    table: str
+    id: int
+    stored: int
+    actual: int
+
+
+def _actual_option_votes():
+    return select(func.count(Vote.id)).where(Vote.option_id == Option.id).scalar_subquery()
+
+
+def _actual_poll_votes():
+    return select(func.count(Vote.id)).where(Vote.poll_id == Poll.id).scalar_subquery()
+
+
+def find_vote_count_drift(db: Session) -> List[CounterDrift]:
+    actual_option_votes = _actual_option_votes()
+    option_rows = db.execute(
+        select(Option.id, Option.votes_count, actual_option_votes.label("actual"))
+        .where(Option.votes_count != actual_option_votes)
+        .order_by(Option.id)
+    ).all()
+
+    actual_poll_votes = _actual_poll_votes()
+    poll_rows = db.execute(
+        select(Poll.id, Poll.total_votes, actual_poll_votes.label("actual"))
+        .where(Poll.total_votes != actual_poll_votes)
+        .order_by(Poll.id)
+    ).all()
+
+    return [
+        CounterDrift(table="options", id=row.id, stored=row.votes_count, actual=row.actual)
+        for row in option_rows
+    ] + [
+        CounterDrift(table="polls", id=row.id, stored=row.total_votes, actual=row.actual)
+        for row in poll_rows
+    ]
+
+
+def reconcile_vote_counts(
+    db: Session, fix: bool = False, cache: ResultsCache = results_cache
+) -> List[CounterDrift]:
+    """
+    Return the drifted counters, rewriting them from votes when fix is set.
+
+    Every poll whose counters were rewritten moves to a new results_version,
+    so ETags, cached aggregates and resuming subscribers do not keep the
+    drifted counts.
+    """
+    drift = find_vote_count_drift(db)
+
+    if fix and drift:
+        # Counted again in the UPDATE itself, so votes committed since the
+        # scan are not lost from the counters
+        option_ids = [item.id for item in drift if item.table == "options"]
+        poll_ids = {item.id for item in drift if item.table == "polls"}
+        if option_ids:
+            poll_ids.update(db.execute(
+                update(Option)
+                .where(Option.id.in_(option_ids))
+                .values(votes_count=_actual_option_votes())
+                .returning(Option.poll_id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+        db.execute(
+            update(Poll)
+            .where(Poll.id.in_(poll_ids))
+            .values(total_votes=_actual_poll_votes(), results_version=Poll.results_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        for poll_id in poll_ids:
+            cache.invalidate(poll_id)
+
+    return drift
+
+
+def main() -> None:
+    from app.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Reconcile denormalized vote counters")
+    parser.add_argument("--fix", action="store_true", help="rewrite drifted counters")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        drift = reconcile_vote_counts(db, fix=args.fix)
+    finally:
+        db.close()
+
+    for item in drift:
+        print(f"{item.table} id={item.id}: stored={item.stored} actual={item.actual}")
+
+    if not drift:
+        print("Vote counters are consistent")
+    elif args.fix:
+        print(f"Fixed {len(drift)} drifted counter(s)")
+    else:
+        print(f"Found {len(drift)} drifted counter(s); rerun with --fix to repair")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,104 +1,237 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from app.db import get_db
-from app.schemas import PollCreate, PollResponse, PollListResponse, VoteRequest, VoteResponse, PollResults, PollUpdateMessage
-from app.polls.service import PollsService
-from app.polls.ws import manager
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from app.config import settings
+from app.db import DBSession, get_db
+from app.schemas import PollCreate, PollResponse, PollListResponse, VoteRequest, VoteResponse, PollResults, VoteAccepted, VoteBatchRequest, VoteBatchResponse
+from app.polls.service import AsyncPollsService
+from app.polls.conditional import etag_matches, results_cache_headers
+from app.polls.pagination import NEXT_CURSOR_HEADER, next_cursor
+from app.polls.buffer import vote_buffer
+from app.polls.outbox import outbox_dispatcher
+from app.polls.sse import EventStreamResponse, poll_event_stream
+from app.polls.ws import manager, poll_state_loader
+from app.responses import fast_json_response
 from app.deps import get_current_user, get_current_user_optional
 from app.schemas import UserResponse
 from typing import Optional
 
 router = APIRouter(prefix="/polls", tags=["polls"])
+# Endpoints outside the /polls prefix
+ws_router = APIRouter(tags=["polls"])
 
 
 @router.get("/", response_model=list[PollListResponse])
-def get_polls(
+async def get_polls(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     search: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    db: DBSession = Depends(get_db),
     current_user: Optional[UserResponse] = Depends(get_current_user_optional)
 ):
-    polls_service = PollsService(db)
+    polls_service = AsyncPollsService(db)
     user_id = current_user.id if current_user else None
-    return polls_service.get_polls(skip=skip, limit=limit, search=search, user_id=user_id)
+    polls = await polls_service.get_polls(skip=skip, limit=limit, search=search, user_id=user_id, cursor=cursor)
+    if not search:
+        # Search pages are ranked by relevance and paged with skip
+        set_next_cursor(response, polls, limit)
+    return respond(polls, response)
 
 
 @router.get("/me", response_model=list[PollListResponse])
-def get_my_polls(
+async def get_my_polls(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     search: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
     current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_db)
 ):
-    polls_service = PollsService(db)
-    return polls_service.get_user_polls(owner_id=current_user.id, skip=skip, limit=limit, search=search, user_id=current_user.id)
+    polls_service = AsyncPollsService(db)
+    polls = await polls_service.get_user_polls(owner_id=current_user.id, skip=skip, limit=limit, search=search, user_id=current_user.id, cursor=cursor)
+    if not search:
+        # Search pages are ranked by relevance and paged with skip
+        set_next_cursor(response, polls, limit)
+    return respond(polls, response)
+
+
+def set_next_cursor(response: Response, polls: list[PollListResponse], limit: int):
+    cursor = next_cursor(polls, limit)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def respond(content, response: Response):
+    """Return content for FastAPI to serialize, or encode it right away with FAST_JSON_RESPONSES."""
+    if settings.fast_json_responses:
+        return fast_json_response(content, response)
+    return content
 
 
 @router.post("/", response_model=PollResults, status_code=status.HTTP_201_CREATED)
-def create_poll(
+async def create_poll(
     poll_data: PollCreate,
     current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_db)
 ):
-    polls_service = PollsService(db)
-    poll = polls_service.create_poll(poll_data, current_user.id)
-    return polls_service.get_poll_with_results(poll.id, current_user.id)
+    polls_service = AsyncPollsService(db)
+    return await polls_service.create_poll_with_results(poll_data, current_user.id)
 
 
 @router.get("/{poll_id}", response_model=PollResults)
-def get_poll(
+async def get_poll(
     poll_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: DBSession = Depends(get_db),
     current_user: Optional[UserResponse] = Depends(get_current_user_optional)
 ):
-    polls_service = PollsService(db)
+    polls_service = AsyncPollsService(db)
     user_id = current_user.id if current_user else None
-    return polls_service.get_poll_with_results(poll_id, user_id)
+    results_version = await polls_service.get_results_version(poll_id)
+    headers = results_cache_headers(results_version, user_id)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    response.headers.update(headers)
+    # Never serve a cached aggregate older than the ETag
+    poll = await polls_service.get_poll_with_results(poll_id, user_id, min_version=results_version)
+    return respond(poll, response)
 
 
-@router.post("/{poll_id}/vote", response_model=VoteResponse)
+@router.post("/votes:batch", response_model=VoteBatchResponse)
+async def ingest_votes(
+    batch: VoteBatchRequest,
+    x_ingest_key: Optional[str] = Header(None),
+    db: DBSession = Depends(get_db)
+):
+    """Votes on behalf of users, for trusted ingesters holding VOTE_INGEST_KEY."""
+    if not settings.vote_ingest_key or not hmac.compare_digest(
+        (x_ingest_key or "").encode(), settings.vote_ingest_key.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid ingest key"
+        )
+    
+    # The last vote of each user on a poll wins
+    votes = {(vote.user_id, vote.poll_id): vote.option_id for vote in batch.votes}
+    polls_service = AsyncPollsService(db)
+    if settings.vote_write_behind:
+        votes = await polls_service.filter_valid_votes(votes)
+        vote_buffer.add(votes)
+        accepted = len(votes)
+    else:
+        accepted = await polls_service.cast_votes(votes)
+        outbox_dispatcher.notify()
+    return VoteBatchResponse(received=len(batch.votes), accepted=accepted)
+
+
+@router.post(
+    "/{poll_id}/vote",
+    response_model=VoteResponse,
+    responses={status.HTTP_202_ACCEPTED: {"model": VoteAccepted, "description": "Buffered for a write-behind flush"}}
+)
 async def vote_on_poll(
     poll_id: int,
     vote_data: VoteRequest,
     current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_db)
 ):
-    polls_service = PollsService(db)
-    result = polls_service.vote_on_poll(poll_id, vote_data.option_id, current_user.id)
-    
-    # Broadcast update via WebSocket
-    update_message = PollUpdateMessage(
-        option_id=vote_data.option_id,
-        votes_count=result.votes_count,
-        total_votes=result.total_votes,
-        poll_id=poll_id
-    )
-    await manager.broadcast_to_poll(poll_id, update_message)
+    polls_service = AsyncPollsService(db)
+    if settings.vote_write_behind:
+        # Counts are not known until the flush; viewers get them over the
+        # WebSocket like any other update
+        await polls_service.check_vote(poll_id, vote_data.option_id)
+        vote_buffer.add({(current_user.id, poll_id): vote_data.option_id})
+        accepted = VoteAccepted(poll_id=poll_id, option_id=vote_data.option_id)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=accepted.model_dump())
     
+    result = await polls_service.vote_on_poll(poll_id, vote_data.option_id, current_user.id)
+    # The update was committed to the outbox with the vote; viewers get it
+    # from the dispatcher without holding up the voter
+    outbox_dispatcher.notify()
     return result
 
 
 @router.websocket("/ws/{poll_id}")
-async def websocket_endpoint(websocket: WebSocket, poll_id: int):
-    await manager.connect(websocket, poll_id)
+async def websocket_endpoint(
+    websocket: WebSocket,
+    poll_id: int,
+    since: Optional[int] = None,
+    db: DBSession = Depends(get_db)
+):
     try:
+        client = await manager.connect(websocket, poll_id, since, load_state=poll_state_loader(db))
+        if client is None:
+            return
         while True:
-            # Keep connection alive
-            data = await websocket.receive_text()
-            # Echo back or handle any client messages if needed
-            await websocket.send_text(f"Echo: {data}")
+            # Only pongs and pings are expected; reading also notices a close
+            await manager.handle_message(client, await websocket.receive_text(), subscriptions=False)
     except WebSocketDisconnect:
-        manager.disconnect(websocket, poll_id)
+        pass
+    finally:
+        # Also after a failed snapshot load or a read from a closed socket
+        manager.disconnect(websocket)
+
+
+@router.get("/{poll_id}/stream", response_class=EventStreamResponse)
+async def stream_poll_updates(
+    poll_id: int,
+    since: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
+    db: DBSession = Depends(get_db)
+):
+    """
+    The poll's updates as Server-Sent Events: the same messages as
+    /polls/ws/{id}, each with its seq as the event id. An EventSource
+    reconnecting with Last-Event-ID gets the updates it missed.
+    """
+    return await poll_event_stream(db, poll_id, since if last_event_id is None else last_event_id)
 
 
 @router.get("/{poll_id}/results", response_model=PollResults)
-def get_poll_results(
+async def get_poll_results(
     poll_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: DBSession = Depends(get_db),
     current_user: Optional[UserResponse] = Depends(get_current_user_optional)
 ):
-    polls_service = PollsService(db)
+    polls_service = AsyncPollsService(db)
     user_id = current_user.id if current_user else None
-    return polls_service.get_poll_results(poll_id, user_id)
+    results_version = await polls_service.get_results_version(poll_id)
+    headers = results_cache_headers(results_version, user_id)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    response.headers.update(headers)
+    # Never serve a cached aggregate older than the ETag
+    results = await polls_service.get_poll_results(poll_id, user_id, min_version=results_version)
+    return respond(results, response)
+
+
+@ws_router.websocket("/ws")
+async def multiplexed_websocket_endpoint(websocket: WebSocket, db: DBSession = Depends(get_db)):
+    """
+    Updates of many polls over one socket. Clients send
+    {"type": "subscribe" | "unsubscribe", "poll_ids": [...]} and receive
+    an acknowledgement, then the updates of every subscribed poll. A
+    subscribe starts with a snapshot of each poll, or with the updates
+    missed since {"since": {poll_id: seq}}. The server sends
+    {"type": "ping"} every heartbeat interval and closes sockets that
+    stay silent for the idle timeout; clients answer {"type": "pong"}.
+    """
+    try:
+        client = await manager.connect(websocket, load_state=poll_state_loader(db))
+        if client is None:
+            return
+        while True:
+            await manager.handle_message(client, await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket)
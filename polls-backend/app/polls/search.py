@@ -0,0 +1,98 @@
+"""
+Indexed full-text search over poll titles and descriptions.
+
+PostgreSQL keeps a generated `polls.search_vector` tsvector column behind a
+GIN index (added by migration 005); SQLite keeps an external-content FTS5
+table, `polls_fts`, in sync with triggers. Both are created alongside the
+polls table by metadata.create_all as well. Every search term is matched
+as a prefix and results are ranked, title matches first.
+"""
+import re
+from typing import List
+
+from sqlalchemy import DDL, event, false, func, literal_column, table, column
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from app.models import Poll
+
+SEARCH_CONFIG = "english"
+MAX_SEARCH_TERMS = 8
+
+search_vector = literal_column("polls.search_vector", type_=TSVECTOR)
+polls_fts = table("polls_fts", column("rowid"))
+
+
+def search_terms(search: str) -> List[str]:
+    return re.findall(r"\w+", search.lower())[:MAX_SEARCH_TERMS]
+
+
+def apply_search(query, search: str, dialect: str):
+    """Filter a select of polls by `search` and order it by relevance."""
+    terms = search_terms(search)
+    if not terms:
+        return query.where(false())
+
+    if dialect == "postgresql":
+        tsquery = func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+        return (
+            query.where(search_vector.op("@@")(tsquery))
+            .order_by(func.ts_rank(search_vector, tsquery).desc())
+        )
+
+    if dialect == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        fts = literal_column("polls_fts")
+        return (
+            query.join(polls_fts, polls_fts.c.rowid == Poll.id)
+            .where(fts.op("MATCH")(match))
+            # bm25 is lower for better matches; weigh the title over the description
+            .order_by(func.bm25(fts, 10.0, 1.0))
+        )
+
+    # No index for other databases; fall back to substring matching
+    return query.where(
+        Poll.title.ilike(f"%{search}%") |
+        Poll.description.ilike(f"%{search}%")
+    )
+
+
+POSTGRES_SEARCH_DDL = [
+    f"""
+    ALTER TABLE polls ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX ix_polls_search_vector ON polls USING GIN (search_vector)",
+]
+
+SQLITE_SEARCH_DDL = [
+    "DROP TABLE IF EXISTS polls_fts",
+    """
+    CREATE VIRTUAL TABLE polls_fts USING fts5(
+        title, description, content='polls', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER polls_fts_insert AFTER INSERT ON polls BEGIN
+        INSERT INTO polls_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER polls_fts_delete AFTER DELETE ON polls BEGIN
+        INSERT INTO polls_fts(polls_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER polls_fts_update AFTER UPDATE OF title, description ON polls BEGIN
+        INSERT INTO polls_fts(polls_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO polls_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(Poll.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Poll.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Poll.__table__, "before_drop", DDL("DROP TABLE IF EXISTS polls_fts").execute_if(dialect="sqlite"))
@@ -1,14 +1,28 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, and_
-from app.models import Poll, Option, Vote, User
-from app.schemas import PollCreate, PollResponse, PollListResponse, VoteRequest, VoteResponse, PollResults, OptionResponse
+from sqlalchemy import select, insert, update, and_, case, literal
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.db import DBSession, run_sync
+from app.models import Poll, Option, Vote, User, OutboxMessage
+from app.schemas import PollCreate, PollResponse, PollListResponse, VoteRequest, VoteResponse, PollResults, OptionResponse, PollUpdateMessage
+from app.polls.cache import PollAggregate, ResultsCache, results_cache
+from app.polls.pagination import after_cursor, order_by
+from app.polls.search import apply_search
 from fastapi import HTTPException, status
-from typing import List, Optional
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Votes to apply together, one per user and poll: (user_id, poll_id) -> option_id
+VoteBatch = Dict[Tuple[int, int], int]
+
+# Rows per multi-row vote upsert, well below the bind parameter limits
+VOTE_UPSERT_ROWS = 500
 
 
 class PollsService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, cache: ResultsCache = results_cache):
         self.db = db
+        self.results_cache = cache
     
     def create_poll(self, poll_data: PollCreate, owner_id: int) -> Poll:
         # Create poll
@@ -32,119 +46,72 @@ class PollsService:
         self.db.refresh(poll)
         return poll
     
-    def get_polls(self, skip: int = 0, limit: int = 10, search: Optional[str] = None, user_id: Optional[int] = None) -> List[PollListResponse]:
+    def get_polls(self, skip: int = 0, limit: int = 10, search: Optional[str] = None, user_id: Optional[int] = None, cursor: Optional[str] = None) -> List[PollListResponse]:
         query = select(Poll)
+        return self._list_polls(query, skip=skip, limit=limit, user_id=user_id, cursor=cursor, search=search)
+    
+    def get_user_polls(self, owner_id: int, skip: int = 0, limit: int = 10, search: Optional[str] = None, user_id: Optional[int] = None, cursor: Optional[str] = None) -> List[PollListResponse]:
+        query = select(Poll).where(Poll.owner_id == owner_id)
+        return self._list_polls(query, skip=skip, limit=limit, user_id=user_id, cursor=cursor, search=search)
+    
+    def _list_polls(self, query, skip: int, limit: int, user_id: Optional[int], cursor: Optional[str] = None, search: Optional[str] = None) -> List[PollListResponse]:
+        """
+        Build a page of poll listings with a fixed number of queries:
+        the page of polls, the options with vote counts for the whole page,
+        and the caller's votes on the page (only when a user is given).
         
+        Pages are ordered newest first, after the relevance order of a
+        search. A cursor continues after the last poll of the previous page
+        and takes precedence over skip; it cannot follow a relevance order.
+        """
+        dialect = self.db.get_bind().dialect.name
         if search:
-            query = query.where(
-                Poll.title.ilike(f"%{search}%") | 
-                Poll.description.ilike(f"%{search}%")
-            )
+            if cursor:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="cursor cannot be combined with search, use skip"
+                )
+            query = apply_search(query, search, dialect)
+        
+        if cursor:
+            query = query.where(after_cursor(cursor, dialect))
+        else:
+            query = query.offset(skip)
         
         polls = self.db.execute(
-            query.offset(skip).limit(limit)
+            query.order_by(*order_by(dialect)).limit(limit)
         ).scalars().all()
         
-        result = []
-        for poll in polls:
-            # Get options with vote counts
-            stmt = (
-                select(
-                    Option.id,
-                    Option.text,
-                    func.count(Vote.id).label("votes_count"),
-                )
-                .outerjoin(Vote, Vote.option_id == Option.id)
-                .where(Option.poll_id == poll.id)
-                .group_by(Option.id, Option.text)
-                .order_by(Option.id)
-            )
-            
-            options_data = self.db.execute(stmt).all()
-            total_votes = sum(item.votes_count for item in options_data)
-            
-            options_response = [
-                OptionResponse(id=item.id, text=item.text, votes_count=item.votes_count)
-                for item in options_data
-            ]
-            
-            # Check if user has voted
-            user_vote = None
-            has_voted = False
-            if user_id:
-                user_vote_result = self.db.execute(
-                    select(Vote.option_id)
-                    .join(Option, Vote.option_id == Option.id)
-                    .where(and_(Vote.user_id == user_id, Option.poll_id == poll.id))
-                ).scalar_one_or_none()
-                
-                if user_vote_result:
-                    user_vote = user_vote_result
-                    has_voted = True
-            
-            result.append(PollListResponse(
-                id=poll.id,
-                title=poll.title,
-                description=poll.description,
-                owner_id=poll.owner_id,
-                created_at=poll.created_at,
-                total_votes=total_votes,
-                options=options_response,
-                hasVoted=has_voted,
-                userVote=user_vote
-            ))
+        if not polls:
+            return []
         
-        return result
-    
-    def get_user_polls(self, owner_id: int, skip: int = 0, limit: int = 10, search: Optional[str] = None, user_id: Optional[int] = None) -> List[PollListResponse]:
-        query = select(Poll).where(Poll.owner_id == owner_id)
+        poll_ids = [poll.id for poll in polls]
         
-        if search:
-            query = query.where(
-                Poll.title.ilike(f"%{search}%") | 
-                Poll.description.ilike(f"%{search}%")
+        # Get options with vote counts for every poll on the page
+        options_data = self.db.execute(
+            select(Option.poll_id, Option.id, Option.text, Option.votes_count)
+            .where(Option.poll_id.in_(poll_ids))
+            .order_by(Option.poll_id, Option.id)
+        ).all()
+        
+        options_by_poll: Dict[int, List[OptionResponse]] = {poll_id: [] for poll_id in poll_ids}
+        for item in options_data:
+            options_by_poll[item.poll_id].append(
+                OptionResponse(id=item.id, text=item.text, votes_count=item.votes_count)
             )
         
-        polls = self.db.execute(
-            query.offset(skip).limit(limit)
-        ).scalars().all()
+        # Get the user's votes on the page
+        user_votes: Dict[int, int] = {}
+        if user_id:
+            user_votes = dict(self.db.execute(
+                select(Vote.poll_id, Vote.option_id)
+                .where(and_(Vote.user_id == user_id, Vote.poll_id.in_(poll_ids)))
+            ).all())
         
         result = []
         for poll in polls:
-            # Get options with vote counts
-            stmt = (
-                select(
-                    Option.id,
-                    Option.text,
-                    func.count(Vote.id).label("votes_count"),
-                )
-                .outerjoin(Vote, Vote.option_id == Option.id)
-                .where(Option.poll_id == poll.id)
-                .group_by(Option.id, Option.text)
-                .order_by(Option.id)
-            )
-            
-            options_data = self.db.execute(stmt).all()
-            total_votes = sum(item.votes_count for item in options_data)
-            
-            options_response = [
-                OptionResponse(id=item.id, text=item.text, votes_count=item.votes_count)
-                for item in options_data
-            ]
-            
-            # Check if user has voted
-            user_vote = None
-            has_voted = False
-            if user_id:
-                user_vote_result = self.db.execute(
-                    select(Vote.option_id)
-                    .join(Option, Vote.option_id == Option.id)
-                    .where(and_(Vote.user_id == user_id, Option.poll_id == poll.id))
-                ).scalar_one_or_none()
-                
-                if user_vote_result:
-                    user_vote = user_vote_result
-                    has_voted = True
+            options_response = options_by_poll[poll.id]
+            user_vote = user_votes.get(poll.id)
             
             result.append(PollListResponse(
                 id=poll.id,
@@ -152,9 +119,9 @@ class PollsService:
                 description=poll.description,
                 owner_id=poll.owner_id,
                 created_at=poll.created_at,
-                total_votes=total_votes,
+                total_votes=poll.total_votes,
                 options=options_response,
-                hasVoted=has_voted,
+                hasVoted=user_vote is not None,
                 userVote=user_vote
             ))
         
@@ -173,107 +140,140 @@ class PollsService:
         
         return poll
     
-    def get_poll_with_results(self, poll_id: int, user_id: Optional[int] = None) -> PollResponse:
+    def get_results_version(self, poll_id: int) -> int:
+        results_version = self.db.execute(
+            select(Poll.results_version).where(Poll.id == poll_id)
+        ).scalar_one_or_none()
+        
+        if results_version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Poll not found"
+            )
+        
+        return results_version
+    
+    def get_poll_with_results(self, poll_id: int, user_id: Optional[int] = None, min_version: int = 0) -> PollResponse:
+        aggregate = self.get_poll_aggregate(poll_id, min_version)
+        user_vote = self._get_user_vote(poll_id, user_id)
+        
+        return PollResponse(
+            id=aggregate.id,
+            title=aggregate.title,
+            description=aggregate.description,
+            owner_id=aggregate.owner_id,
+            created_at=aggregate.created_at,
+            options=self._option_responses(aggregate),
+            total_votes=aggregate.total_votes,
+            hasVoted=user_vote is not None,
+            userVote=user_vote
+        )
+    
+    def get_poll_aggregate(self, poll_id: int, min_version: int = 0) -> PollAggregate:
+        """
+        Poll details with option counts, served from the results cache
+        unless the cached entry is older than results version min_version.
+        """
+        aggregate = self.results_cache.get(poll_id)
+        if aggregate is not None and aggregate.results_version >= min_version:
+            return aggregate
+        
+        version = self.results_cache.version(poll_id)
         poll = self.get_poll_by_id(poll_id)
         
         # Get options with vote counts
-        options_with_votes = self.db.execute(
-            select(Option, func.count(Vote.id).label('votes_count'))
-            .outerjoin(Vote, Option.id == Vote.option_id)
+        poll_options = self.db.execute(
+            select(Option.id, Option.text, Option.votes_count)
             .where(Option.poll_id == poll_id)
-            .group_by(Option.id)
+            .order_by(Option.id)
         ).all()
         
-        options = []
-        total_votes = 0
-        
-        for option, votes_count in options_with_votes:
-            options.append(OptionResponse(
-                id=option.id,
-                text=option.text,
-                votes_count=votes_count
-            ))
-            total_votes += votes_count
-        
-        # Check if user has voted
-        user_vote = None
-        has_voted = False
-        if user_id:
-            user_vote_result = self.db.execute(
-                select(Vote.option_id)
-                .join(Option, Vote.option_id == Option.id)
-                .where(and_(Vote.user_id == user_id, Option.poll_id == poll_id))
-            ).scalar_one_or_none()
-            
-            if user_vote_result:
-                user_vote = user_vote_result
-                has_voted = True
-        
-        return PollResponse(
+        aggregate = PollAggregate(
             id=poll.id,
             title=poll.title,
             description=poll.description,
             owner_id=poll.owner_id,
             created_at=poll.created_at,
-            options=options,
-            total_votes=total_votes,
-            hasVoted=has_voted,
-            userVote=user_vote
+            options=tuple((option.id, option.text, option.votes_count) for option in poll_options),
+            total_votes=poll.total_votes,
+            results_version=poll.results_version
         )
+        self.results_cache.put(poll_id, aggregate, version)
+        return aggregate
     
-    def vote_on_poll(self, poll_id: int, option_id: int, user_id: int) -> VoteResponse:
-        # Verify poll exists
-        poll = self.get_poll_by_id(poll_id)
+    def _option_responses(self, aggregate: PollAggregate) -> List[OptionResponse]:
+        return [
+            OptionResponse(id=id, text=text, votes_count=votes_count)
+            for id, text, votes_count in aggregate.options
+        ]
+    
+    def _get_user_vote(self, poll_id: int, user_id: Optional[int]) -> Optional[int]:
+        """The per-user overlay on top of the shared aggregate."""
+        if not user_id:
+            return None
         
-        # Verify option belongs to this poll
-        option = self.db.execute(
-            select(Option).where(
-                and_(Option.id == option_id, Option.poll_id == poll_id)
-            )
+        return self.db.execute(
+            select(Vote.option_id)
+            .where(and_(Vote.user_id == user_id, Vote.poll_id == poll_id))
         ).scalar_one_or_none()
+    
+    def vote_on_poll(self, poll_id: int, option_id: int, user_id: int) -> VoteResponse:
+        self.results_cache.begin_write(poll_id)
+        try:
+            return self._cast_vote(poll_id, option_id, user_id)
+        finally:
+            self.results_cache.end_write(poll_id)
+    
+    def _cast_vote(self, poll_id: int, option_id: int, user_id: int) -> VoteResponse:
+        # Cast or move the vote in one statement; the unique (user_id, poll_id)
+        # constraint makes concurrent double-submits collapse into one row
+        cast = self.db.execute(self._upsert_vote(poll_id, option_id, user_id)).one_or_none()
         
-        if not option:
+        if cast is None:
+            # Nothing was inserted: either the poll or the option does not exist
+            self.db.rollback()
+            self.get_poll_by_id(poll_id)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid option for this poll"
             )
         
-        # Check if user already voted on this poll
-        existing_vote = self.db.execute(
-            select(Vote)
-            .join(Option, Vote.option_id == Option.id)
-            .where(
-                and_(
-                    Vote.user_id == user_id,
-                    Option.poll_id == poll_id
-                )
+        # (option_id, votes_count) of every option the vote changed
+        changed: List[Tuple[int, int]] = []
+        if cast.previous_option_id is None:
+            votes_count, total_votes, results_version = self._count_new_vote(option_id)
+            changed.append((option_id, votes_count))
+        elif cast.previous_option_id != option_id:
+            previous_votes_count, votes_count, total_votes, results_version = self._move_vote(
+                poll_id, cast.previous_option_id, option_id
             )
-        ).scalar_one_or_none()
-        
-        if existing_vote:
-            # Update existing vote
-            existing_vote.option_id = option_id
+            changed += [(cast.previous_option_id, previous_votes_count), (option_id, votes_count)]
         else:
-            # Create new vote
-            vote = Vote(
-                user_id=user_id,
-                option_id=option_id
-            )
-            self.db.add(vote)
-        
-        self.db.commit()
+            # Same option again, counters and results version are unchanged
+            votes_count, total_votes, results_version = self.db.execute(
+                select(Option.votes_count, Poll.total_votes, Poll.results_version)
+                .join(Poll, Option.poll_id == Poll.id)
+                .where(Option.id == option_id)
+            ).one()
         
-        # Get updated vote counts
-        votes_count = self.db.execute(
-            select(func.count(Vote.id))
-            .where(Vote.option_id == option_id)
-        ).scalar() or 0
+        if changed:
+            # Published by the outbox dispatcher once this transaction
+            # commits; one message and seq per changed option, the last
+            # one at the new results_version
+            first_seq = results_version - len(changed) + 1
+            self.db.execute(insert(OutboxMessage).values([
+                {"payload": PollUpdateMessage(
+                    option_id=changed_option_id,
+                    votes_count=changed_votes_count,
+                    total_votes=total_votes,
+                    poll_id=poll_id,
+                    seq=first_seq + i
+                ).model_dump_json()}
+                for i, (changed_option_id, changed_votes_count) in enumerate(changed)
+            ]))
         
-        total_votes = self.db.execute(
-            select(func.count(Vote.id))
-            .join(Option, Vote.option_id == Option.id)
-            .where(Option.poll_id == poll_id)
-        ).scalar() or 0
+        self.db.commit()
+        self.results_cache.apply_vote(poll_id, option_id, cast.previous_option_id, results_version)
         
         return VoteResponse(
             option_id=option_id,
@@ -281,51 +281,288 @@ class PollsService:
             total_votes=total_votes
         )
     
-    def get_poll_results(self, poll_id: int, user_id: Optional[int] = None) -> PollResults:
-        # Verify poll exists
-        poll = self.get_poll_by_id(poll_id)
+    def _upsert_vote(self, poll_id: int, option_id: int, user_id: int):
+        """
+        INSERT ... SELECT ... ON CONFLICT DO UPDATE ... RETURNING for a vote.
         
-        # Get options with vote counts
-        options_with_votes = self.db.execute(
-            select(Option, func.count(Vote.id).label('votes_count'))
-            .outerjoin(Vote, Option.id == Vote.option_id)
-            .where(Option.poll_id == poll_id)
-            .group_by(Option.id)
-        ).all()
+        Selecting from options only inserts when the option belongs to the
+        poll. On conflict the replaced option is kept in previous_option_id,
+        so the returned row tells a fresh vote from a moved one.
+        """
+        dialect = self.db.get_bind().dialect.name
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
         
-        options = []
-        total_votes = 0
+        stmt = dialect_insert(Vote).from_select(
+            ["user_id", "poll_id", "option_id"],
+            select(literal(user_id), Option.poll_id, Option.id)
+            .where(and_(Option.id == option_id, Option.poll_id == poll_id))
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[Vote.user_id, Vote.poll_id],
+            set_={
+                "option_id": stmt.excluded.option_id,
+                "previous_option_id": Vote.option_id,
+            }
+        ).returning(Vote.option_id, Vote.previous_option_id)
+    
+    def _count_new_vote(self, option_id: int) -> Tuple[int, int, int]:
+        bump_option = (
+            update(Option)
+            .where(Option.id == option_id)
+            .values(votes_count=Option.votes_count + 1)
+            .execution_options(synchronize_session=False)
+        )
         
-        for option, votes_count in options_with_votes:
-            options.append(OptionResponse(
-                id=option.id,
-                text=option.text,
-                votes_count=votes_count
-            ))
-            total_votes += votes_count
+        if self.db.get_bind().dialect.name == "postgresql":
+            # Chain both counters in one statement; the poll row is only
+            # locked after the option row, matching the order used below
+            bumped = bump_option.returning(Option.poll_id, Option.votes_count).cte("bumped")
+            return self.db.execute(
+                update(Poll)
+                .add_cte(bumped)
+                .where(Poll.id == bumped.c.poll_id)
+                .values(total_votes=Poll.total_votes + 1, results_version=Poll.results_version + 1)
+                .returning(bumped.c.votes_count, Poll.total_votes, Poll.results_version)
+                .execution_options(synchronize_session=False)
+            ).one()
         
-        # Check if user has voted
-        user_vote = None
-        has_voted = False
-        if user_id:
-            user_vote_result = self.db.execute(
-                select(Vote.option_id)
-                .join(Option, Vote.option_id == Option.id)
-                .where(and_(Vote.user_id == user_id, Option.poll_id == poll_id))
-            ).scalar_one_or_none()
-            
-            if user_vote_result:
-                user_vote = user_vote_result
-                has_voted = True
+        poll_id, votes_count = self.db.execute(
+            bump_option.returning(Option.poll_id, Option.votes_count)
+        ).one()
+        total_votes, results_version = self.db.execute(
+            update(Poll)
+            .where(Poll.id == poll_id)
+            .values(total_votes=Poll.total_votes + 1, results_version=Poll.results_version + 1)
+            .returning(Poll.total_votes, Poll.results_version)
+            .execution_options(synchronize_session=False)
+        ).one()
+        return votes_count, total_votes, results_version
+    
+    def _move_vote(self, poll_id: int, from_option_id: int, to_option_id: int) -> Tuple[int, int, int, int]:
+        """
+        Move a vote between options; returns both options' counts, the
+        total and the results version, which goes up by one per option.
+        """
+        move = (
+            update(Option)
+            .where(Option.id.in_([from_option_id, to_option_id]))
+            .values(votes_count=Option.votes_count + case((Option.id == to_option_id, 1), else_=-1))
+            .execution_options(synchronize_session=False)
+        )
+        bump_version = (
+            update(Poll)
+            .where(Poll.id == poll_id)
+            .values(results_version=Poll.results_version + 2)
+            .execution_options(synchronize_session=False)
+        )
+        
+        if self.db.get_bind().dialect.name == "postgresql":
+            # Same lock order as _count_new_vote: options, then the poll
+            moved = move.returning(Option.id, Option.votes_count).cte("moved")
+            from_votes_count = select(moved.c.votes_count).where(moved.c.id == from_option_id).scalar_subquery()
+            return self.db.execute(
+                bump_version
+                .add_cte(moved)
+                .where(moved.c.id == to_option_id)
+                .returning(from_votes_count, moved.c.votes_count, Poll.total_votes, Poll.results_version)
+            ).one()
+        
+        rows = dict(self.db.execute(move.returning(Option.id, Option.votes_count)).all())
+        total_votes, results_version = self.db.execute(
+            bump_version.returning(Poll.total_votes, Poll.results_version)
+        ).one()
+        return rows[from_option_id], rows[to_option_id], total_votes, results_version
+    
+    def check_vote(self, poll_id: int, option_id: int) -> None:
+        """Raise unless option_id is an option of the poll; served from the results cache."""
+        aggregate = self.get_poll_aggregate(poll_id)
+        if not any(id == option_id for id, _, _ in aggregate.options):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid option for this poll"
+            )
+    
+    def filter_valid_votes(self, votes: VoteBatch) -> VoteBatch:
+        """The votes by existing users for an option of their poll."""
+        if not votes:
+            return {}
+        option_polls = dict(self.db.execute(
+            select(Option.id, Option.poll_id).where(Option.id.in_(set(votes.values())))
+        ).all())
+        user_ids = set(self.db.execute(
+            select(User.id).where(User.id.in_({user_id for user_id, _ in votes}))
+        ).scalars())
+        return {
+            (user_id, poll_id): option_id
+            for (user_id, poll_id), option_id in votes.items()
+            if user_id in user_ids and option_polls.get(option_id) == poll_id
+        }
+    
+    def cast_votes(self, votes: VoteBatch) -> int:
+        """
+        Apply a batch of votes in one transaction; returns how many were valid.
+        
+        Votes are upserted with multi-row statements and the counters of
+        every option and poll touched are updated once for the whole batch,
+        so the number of statements does not grow with the votes per poll.
+        Invalid votes are skipped. Each option whose count changed gets one
+        update in the outbox.
+        """
+        votes = self.filter_valid_votes(votes)
+        poll_ids = {poll_id for _, poll_id in votes}
+        for poll_id in poll_ids:
+            self.results_cache.begin_write(poll_id)
+        try:
+            self._cast_votes(votes)
+        finally:
+            for poll_id in poll_ids:
+                # Cached entries cannot take a batch as one in-order delta
+                self.results_cache.invalidate(poll_id)
+                self.results_cache.end_write(poll_id)
+        return len(votes)
+    
+    def _cast_votes(self, votes: VoteBatch) -> None:
+        if not votes:
+            return
+        dialect = self.db.get_bind().dialect.name
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        # Vote rows are locked in key order, so concurrent batches touching
+        # the same votes wait for each other instead of deadlocking
+        rows = [
+            {"user_id": user_id, "poll_id": poll_id, "option_id": option_id}
+            for (user_id, poll_id), option_id in sorted(votes.items())
+        ]
+        
+        option_deltas: Counter = Counter()
+        new_votes: Counter = Counter()
+        for start in range(0, len(rows), VOTE_UPSERT_ROWS):
+            stmt = dialect_insert(Vote).values(rows[start:start + VOTE_UPSERT_ROWS])
+            cast = self.db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[Vote.user_id, Vote.poll_id],
+                    set_={
+                        "option_id": stmt.excluded.option_id,
+                        "previous_option_id": Vote.option_id,
+                    }
+                ).returning(Vote.poll_id, Vote.option_id, Vote.previous_option_id)
+            ).all()
+            for poll_id, option_id, previous_option_id in cast:
+                if previous_option_id == option_id:
+                    continue
+                option_deltas[option_id] += 1
+                if previous_option_id is None:
+                    new_votes[poll_id] += 1
+                else:
+                    option_deltas[previous_option_id] -= 1
+        
+        option_deltas = {id: delta for id, delta in option_deltas.items() if delta}
+        if not option_deltas:
+            self.db.commit()
+            return
+        
+        # Options first, then polls, the lock order of single votes
+        options = self.db.execute(
+            update(Option)
+            .where(Option.id.in_(option_deltas))
+            .values(votes_count=Option.votes_count + case(option_deltas, value=Option.id))
+            .returning(Option.id, Option.poll_id, Option.votes_count)
+            .execution_options(synchronize_session=False)
+        ).all()
+        # One update, and so one seq, per changed option
+        updates_by_poll: Dict[int, list] = {}
+        for option in sorted(options, key=lambda option: option.id):
+            updates_by_poll.setdefault(option.poll_id, []).append(option)
+        total_votes = Poll.total_votes
+        if new_votes:
+            total_votes = Poll.total_votes + case(dict(new_votes), value=Poll.id, else_=0)
+        polls = self.db.execute(
+            update(Poll)
+            .where(Poll.id.in_(updates_by_poll))
+            .values(
+                total_votes=total_votes,
+                results_version=Poll.results_version + case(
+                    {poll_id: len(updates) for poll_id, updates in updates_by_poll.items()}, value=Poll.id
+                )
+            )
+            .returning(Poll.id, Poll.total_votes, Poll.results_version)
+            .execution_options(synchronize_session=False)
+        ).all()
+        
+        messages = []
+        for poll_id, total_votes, results_version in polls:
+            updates = updates_by_poll[poll_id]
+            first_seq = results_version - len(updates) + 1
+            messages.extend(
+                {"payload": PollUpdateMessage(
+                    option_id=option.id,
+                    votes_count=option.votes_count,
+                    total_votes=total_votes,
+                    poll_id=poll_id,
+                    seq=first_seq + i
+                ).model_dump_json()}
+                for i, option in enumerate(updates)
+            )
+        # Each poll's updates are inserted, and so published, in seq order
+        self.db.execute(insert(OutboxMessage), messages)
+        self.db.commit()
+    
+    def get_poll_results(self, poll_id: int, user_id: Optional[int] = None, min_version: int = 0) -> PollResults:
+        aggregate = self.get_poll_aggregate(poll_id, min_version)
+        user_vote = self._get_user_vote(poll_id, user_id)
         
         return PollResults(
-            id=poll.id,
-            title=poll.title,
-            description=poll.description,
-            owner_id=poll.owner_id,
-            created_at=poll.created_at,
-            options=options,
-            total_votes=total_votes,
-            hasVoted=has_voted,
+            id=aggregate.id,
+            title=aggregate.title,
+            description=aggregate.description,
+            owner_id=aggregate.owner_id,
+            created_at=aggregate.created_at,
+            options=self._option_responses(aggregate),
+            total_votes=aggregate.total_votes,
+            hasVoted=user_vote is not None,
             userVote=user_vote
         )
+
+
+class AsyncPollsService:
+    """Awaitable PollsService for async routes; see app.db.run_sync."""
+    
+    def __init__(self, db: DBSession):
+        self.db = db
+    
+    async def create_poll_with_results(self, poll_data: PollCreate, owner_id: int) -> PollResponse:
+        def create(session: Session) -> PollResponse:
+            polls_service = PollsService(session)
+            poll = polls_service.create_poll(poll_data, owner_id)
+            return polls_service.get_poll_with_results(poll.id, owner_id)
+        
+        return await run_sync(self.db, create)
+    
+    async def get_polls(self, **kwargs) -> List[PollListResponse]:
+        return await run_sync(self.db, lambda session: PollsService(session).get_polls(**kwargs))
+    
+    async def get_user_polls(self, **kwargs) -> List[PollListResponse]:
+        return await run_sync(self.db, lambda session: PollsService(session).get_user_polls(**kwargs))
+    
+    async def get_results_version(self, poll_id: int) -> int:
+        return await run_sync(self.db, lambda session: PollsService(session).get_results_version(poll_id))
+    
+    async def get_poll_with_results(self, poll_id: int, user_id: Optional[int] = None, min_version: int = 0) -> PollResponse:
+        return await run_sync(self.db, lambda session: PollsService(session).get_poll_with_results(poll_id, user_id, min_version))
+    
+    async def vote_on_poll(self, poll_id: int, option_id: int, user_id: int) -> VoteResponse:
+        return await run_sync(self.db, lambda session: PollsService(session).vote_on_poll(poll_id, option_id, user_id))
+    
+    async def get_poll_results(self, poll_id: int, user_id: Optional[int] = None, min_version: int = 0) -> PollResults:
+        return await run_sync(self.db, lambda session: PollsService(session).get_poll_results(poll_id, user_id, min_version))
+    
+    async def get_poll_aggregate(self, poll_id: int, min_version: int = 0) -> PollAggregate:
+        return await run_sync(self.db, lambda session: PollsService(session).get_poll_aggregate(poll_id, min_version))
+    
+    async def check_vote(self, poll_id: int, option_id: int) -> None:
+        return await run_sync(self.db, lambda session: PollsService(session).check_vote(poll_id, option_id))
+    
+    async def filter_valid_votes(self, votes: VoteBatch) -> VoteBatch:
+        return await run_sync(self.db, lambda session: PollsService(session).filter_valid_votes(votes))
+    
+    async def cast_votes(self, votes: VoteBatch) -> int:
+        return await run_sync(self.db, lambda session: PollsService(session).cast_votes(votes))
@@ -0,0 +1,141 @@
+"""
+Poll updates as Server-Sent Events, for viewers that only read results.
+
+An event stream is one more subscriber of the ConnectionManager: it gets
+the same snapshot, history replay and updates as a WebSocket, through the
+same per-poll fan-out, bounded queue and writer task, but its writes go
+to a streaming HTTP response. Every message that has a seq is sent with
+it as the event id, so a reconnecting EventSource resumes through its
+Last-Event-ID header. The manager's heartbeat sends a keep-alive comment
+instead of a ping, which also keeps proxies from timing the response out.
+"""
+import asyncio
+import json
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import status
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.db import DBSession, run_sync
+from app.polls.service import AsyncPollsService
+from app.polls.ws import ClientConnection, ConnectionManager, LoadState, manager, poll_state_loader
+
+KEEP_ALIVE = ": keep-alive\n\n"
+
+
+@lru_cache(maxsize=256)
+def format_event(payload: str) -> bytes:
+    # A broadcast is one string queued for every subscriber, so it is
+    # framed once rather than once per stream
+    seq = json.loads(payload).get("seq")
+    if seq is None:
+        return f"data: {payload}\n\n".encode()
+    return f"id: {seq}\ndata: {payload}\n\n".encode()
+
+
+class EventStream:
+    """The HTTP response of a stream, written to like a WebSocket by its ClientConnection."""
+
+    def __init__(self, send: Send, headers: list):
+        self._send = send
+        self.headers = headers
+        self.started = False
+        self.closed = False
+
+    async def accept(self):
+        self.started = True
+        await self._send({"type": "http.response.start", "status": status.HTTP_200_OK, "headers": self.headers})
+
+    async def send_text(self, payload: str):
+        # Comments, such as keep-alives, are already framed
+        body = payload.encode() if payload.startswith(":") else format_event(payload)
+        await self._send({"type": "http.response.body", "body": body, "more_body": True})
+
+    async def close(self, code: int = status.WS_1000_NORMAL_CLOSURE):
+        if self.closed:
+            return
+        self.closed = True
+        if not self.started:
+            # Refused at a connection limit, before anything was sent
+            await self._send({
+                "type": "http.response.start",
+                "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+                "headers": [(b"retry-after", b"1")],
+            })
+        await self._send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class StreamConnection(ClientConnection):
+    """
+    A subscriber reading over an event stream. It cannot answer pings, so
+    it is never closed as idle: a reader that is gone shows up as a
+    disconnect, or as a write that fails or times out.
+    """
+
+    def ping(self):
+        self.enqueue(KEEP_ALIVE)
+
+    def is_idle(self, now: float, timeout: float) -> bool:
+        return False
+
+
+class EventStreamResponse(Response):
+    media_type = "text/event-stream"
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        poll_id: int,
+        since: Optional[int] = None,
+        load_state: Optional[LoadState] = None,
+    ):
+        self.manager = manager
+        self.poll_id = poll_id
+        self.since = since
+        self.load_state = load_state
+        self.status_code = status.HTTP_200_OK
+        self.background = None
+        # No body, so no Content-Length; X-Accel-Buffering stops nginx
+        # style proxies from holding events back
+        self.init_headers({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stream = EventStream(send, self.raw_headers)
+        disconnected: Optional[asyncio.Task] = None
+        try:
+            client = await self.manager.connect(
+                stream, self.poll_id, self.since, self.load_state, connection_class=StreamConnection
+            )
+            if client is None:
+                return
+            disconnected = asyncio.create_task(_wait_for_disconnect(receive))
+            # Until the reader leaves, or the manager drops the stream
+            await asyncio.wait({disconnected, client.writer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if disconnected is not None:
+                disconnected.cancel()
+            # Also after a failed snapshot load
+            self.manager.disconnect(stream)
+            try:
+                await stream.close()
+            except Exception:
+                # The reader is gone
+                pass
+
+
+async def _wait_for_disconnect(receive: Receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def poll_event_stream(db: DBSession, poll_id: int, since: Optional[int] = None) -> EventStreamResponse:
+    """The event stream of a poll's updates after since, or 404 if there is no such poll."""
+    try:
+        await AsyncPollsService(db).get_results_version(poll_id)
+    finally:
+        # The stream holds the session, not a connection
+        await run_sync(db, Session.rollback)
+    return EventStreamResponse(manager, poll_id, since, poll_state_loader(db))
@@ -1,50 +1,548 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
-import json
-from app.schemas import PollUpdateMessage
+from fastapi import HTTPException, WebSocket, status
+from sqlalchemy.orm import Session
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Type
+import asyncio
+import logging
+import sys
+import time
+from app.config import settings
+from app.db import DBSession, run_sync
+from app.metrics import Counter, Gauge, Histogram, HistogramMetric, Metric
+from app.polls.bus import BroadcastBus, LocalBus, create_bus
+from app.polls.service import AsyncPollsService
+from app.schemas import (
+    ErrorMessage, HeartbeatMessage, OptionCount, PollSnapshotMessage, PollStateMessage, PollUpdateMessage,
+    SubscriptionMessage, SubscriptionRequest
+)
 
+logger = logging.getLogger(__name__)
 
-class ConnectionManager:
-    def __init__(self):
-        # Dictionary to store connections by poll_id
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+# (poll_id, min_seq) -> the poll's state, or None if there is no such poll
+LoadState = Callable[[int, int], Awaitable[Optional[PollStateMessage]]]
+
+PING = HeartbeatMessage(type="ping").model_dump_json()
+PONG = HeartbeatMessage(type="pong").model_dump_json()
+
+# Close code for connections that stopped answering pings, after HTTP 408
+WS_IDLE_TIMEOUT = 4408
+# Close code for connections dropped after a failed or timed out send
+WS_SEND_FAILED = status.WS_1013_TRY_AGAIN_LATER
+
+# Memory the manager holds per connection besides its queued messages
+# (the client, its queue and writer task) and per subscription, measured
+# with benchmarks.ws_broadcast. The server's own socket buffers come on top
+CONNECTION_BYTES = 4800
+SUBSCRIPTION_BYTES = 112
+
+
+class ClientConnection:
+    """
+    A socket with its own bounded outbound queue and the polls it follows.
     
-    async def connect(self, websocket: WebSocket, poll_id: int):
+    A writer task drains the queue, so a slow client only ever delays its
+    own messages: when its queue is full new messages are skipped, and a
+    send that exceeds the timeout drops the connection.
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager", load_state: Optional[LoadState] = None):
+        self.websocket = websocket
+        self.manager = manager
+        # Loads a poll's state at or after a seq, for snapshots on subscribe
+        self.load_state = load_state
+        self.polls: Set[int] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=manager.queue_size)
+        self.queued_bytes = 0
+        # When the client last sent anything, pongs included
+        self.last_seen = time.monotonic()
+        self.writer = asyncio.create_task(self._write())
+
+    def enqueue(self, payload: str) -> bool:
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            return False
+        self.queued_bytes += sys.getsizeof(payload)
+        return True
+
+    def ping(self):
+        # Skipped like any message if the queue is full
+        self.enqueue(PING)
+
+    def is_idle(self, now: float, timeout: float) -> bool:
+        return now - self.last_seen > timeout
+
+    def memory_bytes(self) -> int:
+        """
+        Estimated memory held for this connection. Queued messages are
+        counted in full, though a broadcast is one string shared by every
+        queue holding it, so summed over connections this is an upper bound.
+        """
+        return CONNECTION_BYTES + SUBSCRIPTION_BYTES * len(self.polls) + self.queued_bytes
+
+    async def _write(self):
+        while True:
+            payload = await self.queue.get()
+            self.queued_bytes -= sys.getsizeof(payload)
+            try:
+                await asyncio.wait_for(self.websocket.send_text(payload), self.manager.send_timeout)
+            except Exception:
+                # Timed out or the socket is gone; closing it makes a client
+                # that is still there reconnect instead of waiting for
+                # updates that will never come
+                self.manager.dropped_connections += 1
+                self.manager.close(self.websocket, WS_SEND_FAILED)
+                return
+
+
+class PollHistory:
+    """
+    The last updates of one poll, keyed by their consecutive seq.
+
+    Kept gap free: an update that does not directly follow the latest one
+    (this worker missed some) restarts the history, so a client can only
+    resume from it when every update after its seq is still held.
+    """
+
+    def __init__(self, size: int):
+        self.updates: Deque[Tuple[int, str]] = deque(maxlen=size)
+
+    @property
+    def latest(self) -> Optional[int]:
+        return self.updates[-1][0] if self.updates else None
+
+    def record(self, seq: int, payload: str) -> bool:
+        """Add an update; returns False for one already seen."""
+        latest = self.latest
+        if latest is not None and seq <= latest:
+            return False
+        if latest is not None and seq != latest + 1:
+            self.updates.clear()
+        self.updates.append((seq, payload))
+        return True
+
+    def since(self, seq: int) -> Optional[List[str]]:
+        """The updates after seq, or None if some of them are no longer held."""
+        if not self.updates or seq < self.updates[0][0] - 1 or seq > self.updates[-1][0]:
+            return None
+        return [payload for update_seq, payload in self.updates if update_seq > seq]
+
+
+class PendingSnapshot:
+    def __init__(self):
+        self.option_counts: Dict[int, int] = {}
+        self.total_votes = 0
+        self.seq: Optional[int] = None
+
+
+class BroadcastCoalescer:
+    """
+    Merges per-poll updates into one PollSnapshotMessage per interval.
+
+    An update for a poll that has been quiet for a full interval is sent
+    right away; updates arriving sooner are merged and sent together when
+    the interval ends. At most max_polls polls are held at once, beyond
+    that everything pending is flushed early.
+    """
+
+    def __init__(self, fan_out: Callable[[int, str], None], interval: float, max_polls: int):
+        self.fan_out = fan_out
+        self.interval = interval
+        self.max_polls = max_polls
+        self._pending: Dict[int, PendingSnapshot] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._last_sent: Dict[int, float] = {}
+
+    def add(self, message: PollUpdateMessage):
+        poll_id = message.poll_id
+        pending = self._pending.setdefault(poll_id, PendingSnapshot())
+        pending.option_counts[message.option_id] = message.votes_count
+        pending.total_votes = message.total_votes
+        if message.seq is not None:
+            pending.seq = message.seq
+
+        if poll_id in self._timers:
+            return
+
+        loop = asyncio.get_running_loop()
+        wait = self._last_sent.get(poll_id, float("-inf")) + self.interval - loop.time()
+        if wait <= 0:
+            self.flush(poll_id)
+        else:
+            self._timers[poll_id] = loop.call_later(wait, self.flush, poll_id)
+
+        if len(self._pending) > self.max_polls:
+            self.flush_all()
+
+    def flush(self, poll_id: int):
+        timer = self._timers.pop(poll_id, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(poll_id, None)
+        if pending is None:
+            return
+
+        now = asyncio.get_running_loop().time()
+        self._last_sent[poll_id] = now
+        if len(self._last_sent) > self.max_polls:
+            # Polls quiet for a full interval would be sent right away anyway
+            self._last_sent = {
+                id: sent for id, sent in self._last_sent.items()
+                if now - sent < self.interval
+            }
+
+        snapshot = PollSnapshotMessage(
+            poll_id=poll_id,
+            options=[
+                OptionCount(option_id=option_id, votes_count=votes_count)
+                for option_id, votes_count in pending.option_counts.items()
+            ],
+            total_votes=pending.total_votes,
+            seq=pending.seq
+        )
+        self.fan_out(poll_id, snapshot.model_dump_json(exclude_none=True))
+
+    def flush_all(self):
+        for poll_id in list(self._pending):
+            self.flush(poll_id)
+
+
+# Seconds to hand one update to every local subscriber's queue
+FAN_OUT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+# Estimated bytes held per connection
+MEMORY_BUCKETS = (4096, 8192, 16384, 32768, 65536, 131072, 262144, 1048576)
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        queue_size: int = settings.ws_queue_size,
+        send_timeout: float = settings.ws_send_timeout_seconds,
+        coalesce_interval: float = settings.ws_coalesce_interval_ms / 1000,
+        coalesce_max_polls: int = settings.ws_coalesce_max_polls,
+        max_subscriptions: int = settings.ws_max_subscriptions,
+        history_size: int = settings.ws_history_size,
+        history_max_polls: int = settings.ws_history_max_polls,
+        heartbeat_interval: float = settings.ws_heartbeat_interval_seconds,
+        idle_timeout: float = settings.ws_idle_timeout_seconds,
+        max_connections: int = settings.ws_max_connections,
+        max_connections_per_poll: int = settings.ws_max_connections_per_poll,
+        bus: Optional[BroadcastBus] = None,
+    ):
+        # Subscriptions are indexed both ways: sockets by poll_id, keyed by
+        # socket for O(1) removal, and each client's polls on the client
+        self.active_connections: Dict[int, Dict[WebSocket, ClientConnection]] = {}
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.max_subscriptions = max_subscriptions
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self.max_connections_per_poll = max_connections_per_poll
+        # Recent updates of the most recently updated polls, for resuming
+        self.history: "OrderedDict[int, PollHistory]" = OrderedDict()
+        self.history_size = history_size
+        self.history_max_polls = history_max_polls
+        self.skipped_messages = 0
+        self.dropped_connections = 0
+        self.idle_connections = 0
+        # Refused connections and subscriptions by the limit they hit
+        self.rejected_connections: Dict[str, int] = {"instance": 0, "poll": 0}
+        self.fan_out_seconds = Histogram(FAN_OUT_BUCKETS)
+        self.coalescer: Optional[BroadcastCoalescer] = None
+        if coalesce_interval > 0:
+            self.coalescer = BroadcastCoalescer(self.fan_out, coalesce_interval, coalesce_max_polls)
+        self.bus = bus or LocalBus()
+        self.bus.subscribe(self.deliver)
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+
+    async def start(self):
+        await self.bus.start()
+        if self.heartbeat_interval > 0:
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        await self.bus.stop()
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.heartbeat()
+            except Exception:
+                logger.exception("WebSocket heartbeat failed")
+
+    def heartbeat(self):
+        """
+        Ping every connection and close those that sent nothing for longer
+        than idle_timeout. A half-open socket never fails its sends until
+        the OS gives up on it, so this is what finds it.
+        """
+        now = time.monotonic()
+        for client in list(self.clients.values()):
+            if self.idle_timeout > 0 and client.is_idle(now, self.idle_timeout):
+                self.idle_connections += 1
+                self.close(client.websocket, WS_IDLE_TIMEOUT)
+            else:
+                client.ping()
+
+    def close(self, websocket: WebSocket, code: int):
+        """Disconnect a socket now and send its close frame in the background."""
+        self.disconnect(websocket)
+        task = asyncio.create_task(self._send_close(websocket, code))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _send_close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code), self.send_timeout)
+        except Exception:
+            # Already gone
+            pass
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        poll_id: Optional[int] = None,
+        since: Optional[int] = None,
+        load_state: Optional[LoadState] = None,
+        connection_class: Type[ClientConnection] = ClientConnection,
+    ) -> Optional[ClientConnection]:
+        """
+        Accept the socket and subscribe it to poll_id, if given. Returns
+        None, having refused the socket before the handshake completes,
+        when this worker or the poll is at its connection limit.
+        """
+        if len(self.clients) >= self.max_connections:
+            return await self._reject(websocket, "instance")
+        if poll_id is not None and not self._has_room(poll_id):
+            return await self._reject(websocket, "poll")
+
         await websocket.accept()
-        if poll_id not in self.active_connections:
-            self.active_connections[poll_id] = []
-        self.active_connections[poll_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, poll_id: int):
-        if poll_id in self.active_connections:
-            self.active_connections[poll_id].remove(websocket)
-            if not self.active_connections[poll_id]:
-                del self.active_connections[poll_id]
-    
+        client = connection_class(websocket, self, load_state)
+        self.clients[websocket] = client
+        if poll_id is not None:
+            await self.subscribe(client, [poll_id], {} if since is None else {poll_id: since})
+        return client
+
+    async def _reject(self, websocket: WebSocket, limit: str) -> None:
+        self.rejected_connections[limit] += 1
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+
+    def _has_room(self, poll_id: int) -> bool:
+        return len(self.active_connections.get(poll_id, ())) < self.max_connections_per_poll
+
+    async def subscribe(
+        self, client: ClientConnection, poll_ids: Iterable[int], since: Optional[Dict[int, int]] = None
+    ) -> List[int]:
+        """
+        Subscribe the client to poll_ids; returns the polls that were new to it.
+
+        A client that gives the last seq it saw of a poll gets the updates it
+        missed from the poll's history. Otherwise, or when the history no
+        longer reaches back that far, it gets a snapshot of the poll first
+        (with the client's load_state), followed by any update newer than
+        the snapshot.
+        """
+        since = since or {}
+        added = []
+        for poll_id in dict.fromkeys(poll_ids):
+            if poll_id in client.polls:
+                continue
+            if not self._has_room(poll_id):
+                self.rejected_connections["poll"] += 1
+                client.enqueue(ErrorMessage(
+                    detail=f"Poll {poll_id} has too many subscribers, try again later"
+                ).model_dump_json())
+                continue
+            history = self.history.get(poll_id)
+            missed = None
+            if poll_id in since and history is not None:
+                missed = history.since(since[poll_id])
+
+            if missed is None and client.load_state is not None:
+                # Never older than the history, so the two join up
+                state = await client.load_state(poll_id, (history and history.latest) or 0)
+                if client.websocket not in self.clients or poll_id in client.polls:
+                    # Disconnected or subscribed meanwhile
+                    continue
+                if state is None:
+                    client.enqueue(ErrorMessage(detail=f"Poll {poll_id} not found").model_dump_json())
+                    continue
+                client.enqueue(state.model_dump_json())
+                history = self.history.get(poll_id)
+                missed = (history and history.since(state.seq)) or []
+
+            for payload in missed or []:
+                client.enqueue(payload)
+            # No await since the history was read, so no update falls between
+            client.polls.add(poll_id)
+            self.active_connections.setdefault(poll_id, {})[client.websocket] = client
+            added.append(poll_id)
+        return added
+
+    def unsubscribe(self, client: ClientConnection, poll_ids: Iterable[int]) -> List[int]:
+        """Unsubscribe the client from poll_ids; returns the polls it had followed."""
+        removed = [poll_id for poll_id in dict.fromkeys(poll_ids) if poll_id in client.polls]
+        for poll_id in removed:
+            client.polls.discard(poll_id)
+            connections = self.active_connections.get(poll_id)
+            if connections is not None:
+                connections.pop(client.websocket, None)
+                if not connections:
+                    del self.active_connections[poll_id]
+        return removed
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        # O(subscriptions of this client), whatever the number of sockets
+        self.unsubscribe(client, list(client.polls))
+        if client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    async def handle_message(self, client: ClientConnection, data: str, subscriptions: bool = True):
+        """
+        Note the client as alive, answer its pings, and, with subscriptions,
+        apply a subscribe / unsubscribe request and acknowledge it. Other
+        messages are ignored.
+        """
+        client.last_seen = time.monotonic()
+        try:
+            heartbeat = HeartbeatMessage.model_validate_json(data)
+        except ValueError:
+            pass
+        else:
+            if heartbeat.type == "ping":
+                client.enqueue(PONG)
+            return
+        if not subscriptions:
+            return
+
+        try:
+            request = SubscriptionRequest.model_validate_json(data)
+        except ValueError:
+            client.enqueue(ErrorMessage(detail="Expected a subscribe or unsubscribe message with poll_ids").model_dump_json())
+            return
+
+        if request.type == "unsubscribe":
+            removed = self.unsubscribe(client, request.poll_ids)
+            client.enqueue(SubscriptionMessage(type="unsubscribed", poll_ids=removed).model_dump_json())
+            return
+
+        new = set(request.poll_ids) - client.polls
+        if len(client.polls) + len(new) > self.max_subscriptions:
+            client.enqueue(ErrorMessage(
+                detail=f"At most {self.max_subscriptions} polls per connection"
+            ).model_dump_json())
+            return
+        added = await self.subscribe(client, request.poll_ids, request.since)
+        client.enqueue(SubscriptionMessage(type="subscribed", poll_ids=added).model_dump_json())
+
     async def broadcast_to_poll(self, poll_id: int, message: PollUpdateMessage):
-        if poll_id in self.active_connections:
-            # Create a copy of the list to avoid modification during iteration
-            connections = self.active_connections[poll_id].copy()
-            for connection in connections:
-                try:
-                    await connection.send_text(json.dumps(message.dict()))
-                except:
-                    # Remove disconnected connections
-                    if connection in self.active_connections[poll_id]:
-                        self.active_connections[poll_id].remove(connection)
+        # Every worker's manager receives the message from the bus and
+        # fans it out to its own sockets
+        await self.bus.publish(message)
 
+    def deliver(self, message: PollUpdateMessage):
+        payload = message.model_dump_json(exclude_none=True)
+        if message.seq is not None and not self._record(message.poll_id, message.seq, payload):
+            # Already delivered, e.g. published twice by the outbox
+            return
 
-manager = ConnectionManager()
+        if message.poll_id not in self.active_connections:
+            return
 
+        if self.coalescer is not None:
+            self.coalescer.add(message)
+            return
+
+        self.fan_out(message.poll_id, payload)
+
+    def _record(self, poll_id: int, seq: int, payload: str) -> bool:
+        history = self.history.get(poll_id)
+        if history is None:
+            history = self.history[poll_id] = PollHistory(self.history_size)
+            while len(self.history) > self.history_max_polls:
+                self.history.popitem(last=False)
+        self.history.move_to_end(poll_id)
+        return history.record(seq, payload)
+
+    def fan_out(self, poll_id: int, payload: str):
+        connections = self.active_connections.get(poll_id)
+        if not connections:
+            return
+
+        # The payload is encoded once for every subscriber; the writer tasks
+        # send it concurrently
+        started = time.perf_counter()
+        for client in list(connections.values()):
+            if not client.enqueue(payload):
+                self.skipped_messages += 1
+        self.fan_out_seconds.observe(time.perf_counter() - started)
+    
+    def collect_metrics(self) -> List[Metric]:
+        connections = Gauge("ws_connections", "WebSocket connections by poll.", ("poll_id",))
+        for poll_id, clients in list(self.active_connections.items()):
+            connections.set(str(poll_id), value=len(clients))
+        skipped = Counter("ws_skipped_messages_total", "Updates skipped because a client's queue was full.")
+        skipped.set(value=self.skipped_messages)
+        dropped = Counter("ws_dropped_connections_total", "Connections dropped after a failed or timed out send.")
+        dropped.set(value=self.dropped_connections)
+        fan_out = HistogramMetric("ws_broadcast_duration_seconds", "Time to queue an update for every local subscriber.")
+        fan_out.attach(histogram=self.fan_out_seconds)
+        rejected = Counter(
+            "ws_rejected_connections_total",
+            "Connections and subscriptions refused at the per-worker or per-poll limit.",
+            ("limit",)
+        )
+        for limit, count in self.rejected_connections.items():
+            rejected.set(limit, value=count)
+        idle = Counter("ws_idle_connections_total", "Connections closed after sending nothing for the idle timeout.")
+        idle.set(value=self.idle_connections)
+        open_connections = Gauge("ws_open_connections", "WebSocket connections open on this worker.")
+        open_connections.set(value=len(self.clients))
+        memory = HistogramMetric(
+            "ws_connection_memory_bytes", "Estimated memory held per connection, queued messages included.",
+            buckets=MEMORY_BUCKETS
+        )
+        queued = Gauge("ws_queued_bytes", "Bytes of messages waiting in connection queues.")
+        queued_bytes = 0
+        for client in list(self.clients.values()):
+            memory.observe(value=client.memory_bytes())
+            queued_bytes += client.queued_bytes
+        queued.set(value=queued_bytes)
+        return [connections, skipped, dropped, fan_out, rejected, idle, open_connections, memory, queued]
+
+
+def poll_state_loader(db: DBSession) -> LoadState:
+    """Snapshots of polls from the results cache, read through the connection's session."""
+    async def load_state(poll_id: int, min_seq: int) -> Optional[PollStateMessage]:
+        try:
+            aggregate = await AsyncPollsService(db).get_poll_aggregate(poll_id, min_seq)
+        except HTTPException:
+            return None
+        finally:
+            # Hand the connection back to the pool between subscribes
+            await run_sync(db, Session.rollback)
+        return PollStateMessage(
+            poll_id=poll_id,
+            seq=aggregate.results_version,
+            options=[OptionCount(option_id=id, votes_count=votes_count) for id, _, votes_count in aggregate.options],
+            total_votes=aggregate.total_votes
+        )
+    
+    return load_state
 
-async def websocket_endpoint(websocket: WebSocket, poll_id: int):
-    await manager.connect(websocket, poll_id)
-    try:
-        while True:
-            # Keep connection alive
-            data = await websocket.receive_text()
-            # Echo back or handle any client messages if needed
-            await websocket.send_text(f"Echo: {data}")
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, poll_id)
 
+manager = ConnectionManager(bus=create_bus())
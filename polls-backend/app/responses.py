@@ -0,0 +1,37 @@
+"""
+orjson fast path for large read responses (FAST_JSON_RESPONSES).
+
+Routes normally return Pydantic models, which FastAPI dumps, validates
+again against the response_model and encodes with the standard json
+module. The services already build those models from typed columns, so
+FastJSONResponse skips all of that and has orjson encode the models'
+fields directly.
+"""
+from typing import Any
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+
+def _model_fields(value: Any) -> Any:
+    # Called by orjson for types it cannot encode natively; the fields of a
+    # response model are plain values or further models
+    if isinstance(value, BaseModel):
+        return value.__dict__
+    raise TypeError
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        # OPT_UTC_Z writes UTC as "Z", like Pydantic does
+        return orjson.dumps(content, default=_model_fields, option=orjson.OPT_UTC_Z)
+
+
+def fast_json_response(content: Any, response: Response) -> FastJSONResponse:
+    """Encode content with FastJSONResponse, keeping the headers set on the route's response."""
+    fast = FastJSONResponse(content)
+    fast.raw_headers.extend(response.raw_headers)
+    return fast
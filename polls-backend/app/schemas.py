@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, List, Literal, Optional
 from datetime import datetime
 
 
@@ -29,9 +29,14 @@ class LoginRequest(BaseModel):
 
 class TokenResponse(BaseModel):
     access_token: str
+    refresh_token: Optional[str] = None
     token_type: str = "bearer"
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 # Poll schemas
 class OptionBase(BaseModel):
     text: str
@@ -97,6 +102,28 @@ class VoteResponse(BaseModel):
     total_votes: int
 
 
+# Answer to a vote taken into the write-behind buffer
+class VoteAccepted(BaseModel):
+    poll_id: int
+    option_id: int
+
+
+class BatchVote(BaseModel):
+    poll_id: int
+    option_id: int
+    user_id: int
+
+
+class VoteBatchRequest(BaseModel):
+    votes: List[BatchVote] = Field(max_length=10000)
+
+
+class VoteBatchResponse(BaseModel):
+    received: int
+    # Valid votes left after keeping the last vote of each user per poll
+    accepted: int
+
+
 # Results schema
 class PollResults(BaseModel):
     id: int
@@ -116,3 +143,52 @@ class PollUpdateMessage(BaseModel):
     votes_count: int
     total_votes: int
     poll_id: int
+    # The poll's results_version after this update; consecutive per poll
+    seq: Optional[int] = None
+
+
+class OptionCount(BaseModel):
+    option_id: int
+    votes_count: int
+
+
+class PollSnapshotMessage(BaseModel):
+    """Coalesced update: every option count changed since the last message."""
+    poll_id: int
+    options: List[OptionCount]
+    total_votes: int
+    # seq of the last update merged in
+    seq: Optional[int] = None
+
+
+class PollStateMessage(BaseModel):
+    """Every option count of a poll as of seq, sent on subscribe."""
+    type: Literal["snapshot"] = "snapshot"
+    poll_id: int
+    seq: int
+    options: List[OptionCount]
+    total_votes: int
+
+
+# Multiplexed WebSocket protocol (/ws): client requests and their answers
+class SubscriptionRequest(BaseModel):
+    type: Literal["subscribe", "unsubscribe"]
+    poll_ids: List[int]
+    # Last seq the client saw per poll, to resume instead of a snapshot
+    since: Dict[int, int] = {}
+
+
+class SubscriptionMessage(BaseModel):
+    type: Literal["subscribed", "unsubscribed"]
+    # The polls whose subscription changed
+    poll_ids: List[int]
+
+
+class ErrorMessage(BaseModel):
+    type: Literal["error"] = "error"
+    detail: str
+
+
+class HeartbeatMessage(BaseModel):
+    # The server pings every connection; clients answer with a pong
+    type: Literal["ping", "pong"]
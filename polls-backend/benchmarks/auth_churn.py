@@ -0,0 +1,118 @@
+"""
+Token renewal load test: sustained /auth/login churn against /auth/refresh churn.
+
+Usage:
+    python -m benchmarks.auth_churn [--users 200] [--concurrency 16] [--duration 10]
+                                    [--database-url postgresql+psycopg2://...]
+
+Runs the app in-process over ASGI against a scratch database (a temporary
+SQLite file by default; never point this at a database you care about).
+Each client renews its token back to back for the duration, first by
+logging in again, then by rotating its refresh token. Prints one JSON
+object per mode with throughput and latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.auth.hashing import get_password_hash
+from app.db import Base, get_db
+from app.main import app
+from app.models import User
+
+PASSWORD = "benchmark-password"
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def churn(client: httpx.AsyncClient, mode: str, email: str, deadline: float, latencies):
+    response = await client.post("/auth/login", json={"email": email, "password": PASSWORD})
+    refresh_token = response.json()["refresh_token"]
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if mode == "login":
+            response = await client.post("/auth/login", json={"email": email, "password": PASSWORD})
+        else:
+            response = await client.post("/auth/refresh", json={"refresh_token": refresh_token})
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+        refresh_token = response.json()["refresh_token"]
+
+
+async def run(mode: str, users: int, concurrency: int, duration: float) -> dict:
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            churn(client, mode, f"user{i % users}@example.com", deadline, latencies)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "benchmark": "auth_churn",
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare login and refresh token renewal under load")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--database-url", default=None, help="scratch database (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f"sqlite:///{os.path.join(directory, 'auth_bench.db')}"
+        engine = create_engine(url)
+        SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+        def bench_get_db():
+            db = SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = bench_get_db
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        password_hash = get_password_hash(PASSWORD)
+        with engine.begin() as connection:
+            connection.execute(insert(User), [
+                {"email": f"user{i}@example.com", "name": f"User {i}", "password_hash": password_hash}
+                for i in range(args.users)
+            ])
+
+        try:
+            for mode in ("login", "refresh"):
+                result = asyncio.run(run(mode, args.users, args.concurrency, args.duration))
+                print(json.dumps(result), flush=True)
+        finally:
+            app.dependency_overrides.pop(get_db, None)
+            Base.metadata.drop_all(bind=engine)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Synthetic dataset generator with bulk loaders.
+
+Usage:
+    python -m benchmarks.dataset --database-url URL [--reset]
+                                 [--users 100000] [--polls 10000]
+                                 [--options-min 2] [--options-max 6]
+                                 [--votes-per-user 10] [--zipf 1.1] [--days 365]
+
+Poll popularity follows a Zipf distribution over a random ranking of the
+polls, so a few polls get most of the votes. Votes per user are drawn
+from an exponential distribution with the given mean, each user votes at
+most once per poll, and options within a poll are picked uniformly.
+
+Rows go in through COPY on PostgreSQL and executemany on SQLite, in
+chunks, and the vote counters are recomputed with one set-based UPDATE
+per table at the end. Without --reset, new ids continue after the
+existing rows. Every user's password is --password.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import random
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, func, select
+
+from app.auth.hashing import get_password_hash
+from app.db import Base
+from app.models import User, Poll, Option
+# Registers the search index DDL, created along with the polls table
+import app.polls.search  # noqa: F401
+
+CHUNK_SIZE = 100000
+
+WORDS = (
+    "best favourite language framework city team season movie book album game food drink "
+    "holiday sport editor database cloud coffee tea weekend music podcast show pet colour "
+    "breakfast lunch dinner park beach mountain river travel office remote meeting release"
+).split()
+
+
+class BulkLoader:
+    """Chunked inserts over a raw DBAPI connection: COPY or executemany."""
+
+    def __init__(self, engine):
+        self.dialect = engine.dialect.name
+        if self.dialect not in ("postgresql", "sqlite"):
+            raise SystemExit(f"Unsupported database: {self.dialect}")
+        self.connection = engine.raw_connection()
+        if self.dialect == "sqlite":
+            cursor = self.connection.cursor()
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.close()
+
+    def timestamp(self, value: datetime) -> str:
+        if self.dialect == "sqlite":
+            # SQLAlchemy's storage format for SQLite DateTime columns
+            return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+        return value.isoformat()
+
+    def load(self, table: str, columns, rows) -> int:
+        total = 0
+        cursor = self.connection.cursor()
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, CHUNK_SIZE))
+            if not chunk:
+                break
+            if self.dialect == "postgresql":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(chunk)
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            else:
+                placeholders = ", ".join("?" for _ in columns)
+                cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", chunk)
+            total += len(chunk)
+        self.connection.commit()
+        cursor.close()
+        return total
+
+    def execute(self, statement: str, parameters=()) -> None:
+        cursor = self.connection.cursor()
+        cursor.execute(statement.replace("?", "%s") if self.dialect == "postgresql" else statement, parameters)
+        self.connection.commit()
+        cursor.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def generate(args, loader: BulkLoader, first_user: int, first_poll: int, first_option: int) -> dict:
+    rng = random.Random(args.seed)
+    timings = {}
+    now = datetime.now(timezone.utc)
+    user_ids = range(first_user, first_user + args.users)
+    poll_ids = range(first_poll, first_poll + args.polls)
+
+    started = time.perf_counter()
+    password_hash = get_password_hash(args.password)
+    loader.load("users", ("id", "email", "name", "password_hash", "created_at"), (
+        (id, f"user{id}@example.com", f"User {id}", password_hash, loader.timestamp(now))
+        for id in user_ids
+    ))
+    timings["users"] = time.perf_counter() - started
+
+    # Creation times spread over --days, increasing with the id
+    started = time.perf_counter()
+    span = timedelta(days=args.days)
+    loader.load("polls", ("id", "title", "description", "owner_id", "created_at"), (
+        (
+            id,
+            " ".join(rng.choices(WORDS, k=4)).capitalize() + "?",
+            " ".join(rng.choices(WORDS, k=12)),
+            rng.choice(user_ids),
+            loader.timestamp(now - span + span * ((id - first_poll + rng.random()) / args.polls)),
+        )
+        for id in poll_ids
+    ))
+    timings["polls"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    option_start = array("q")
+    option_count = array("H")
+    next_option = first_option
+    for _ in poll_ids:
+        count = rng.randint(args.options_min, args.options_max)
+        option_start.append(next_option)
+        option_count.append(count)
+        next_option += count
+    loader.load("options", ("id", "poll_id", "text"), (
+        (option_start[index] + n, poll_id, f"Option {n + 1}")
+        for index, poll_id in enumerate(poll_ids)
+        for n in range(option_count[index])
+    ))
+    timings["options"] = time.perf_counter() - started
+
+    # Zipf weights over a random ranking of the polls
+    ranking = list(range(args.polls))
+    rng.shuffle(ranking)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** args.zipf for rank in range(args.polls)))
+
+    def votes():
+        for user_id in user_ids:
+            wanted = min(args.polls, int(rng.expovariate(1 / args.votes_per_user))) if args.votes_per_user > 0 else 0
+            chosen = set()
+            # Popular polls repeat; give up on a user after a few rounds
+            for _ in range(8):
+                if len(chosen) >= wanted:
+                    break
+                chosen.update(rng.choices(ranking, cum_weights=cum_weights, k=wanted - len(chosen)))
+            for index in chosen:
+                option_id = option_start[index] + rng.randrange(option_count[index])
+                yield (user_id, first_poll + index, option_id)
+
+    started = time.perf_counter()
+    vote_total = loader.load("votes", ("user_id", "poll_id", "option_id"), votes())
+    timings["votes"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    loader.execute(
+        "UPDATE options SET votes_count = counts.votes FROM ("
+        " SELECT option_id, count(*) AS votes FROM votes WHERE poll_id >= ? GROUP BY option_id"
+        ") AS counts WHERE options.id = counts.option_id",
+        (first_poll,)
+    )
+    loader.execute(
+        "UPDATE polls SET total_votes = counts.votes FROM ("
+        " SELECT poll_id, count(*) AS votes FROM votes WHERE poll_id >= ? GROUP BY poll_id"
+        ") AS counts WHERE polls.id = counts.poll_id",
+        (first_poll,)
+    )
+    if loader.dialect == "postgresql":
+        # Ids were given explicitly, so move the sequences past them
+        for table in ("users", "polls", "options"):
+            loader.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))")
+    timings["counters"] = time.perf_counter() - started
+
+    return {
+        "benchmark": "dataset",
+        "dialect": loader.dialect,
+        "users": args.users,
+        "polls": args.polls,
+        "options": next_option - first_option,
+        "votes": vote_total,
+        "votes_per_second": round(vote_total / timings["votes"], 1) if timings["votes"] else None,
+        "seconds": {step: round(seconds, 2) for step, seconds in timings.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk-generate users, polls, options and votes")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--polls", type=int, default=10000)
+    parser.add_argument("--options-min", type=int, default=2)
+    parser.add_argument("--options-max", type=int, default=6)
+    parser.add_argument("--votes-per-user", type=float, default=10.0, help="mean votes cast by a user")
+    parser.add_argument("--zipf", type=float, default=1.1, help="poll popularity exponent")
+    parser.add_argument("--days", type=int, default=365, help="period the polls were created over")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        first_user, first_poll, first_option = (
+            connection.execute(select(func.coalesce(func.max(model.id), 0) + 1)).scalar_one()
+            for model in (User, Poll, Option)
+        )
+
+    loader = BulkLoader(engine)
+    try:
+        print(json.dumps(generate(args, loader, first_user, first_poll, first_option)), flush=True)
+    finally:
+        loader.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
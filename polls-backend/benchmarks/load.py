@@ -0,0 +1,258 @@
+"""
+End-to-end load benchmark against a local uvicorn worker.
+
+Usage:
+    python -m benchmarks.load [--duration 20] [--voters 8] [--listers 4] [--readers 4]
+                              [--subscribers 100] [--users 2000] [--polls 500] [--options 4]
+                              [--database-url postgresql+psycopg2://...] [--port 8765]
+
+Seeds a scratch database (a temporary SQLite file by default; never point
+this at a database you care about), starts `uvicorn app.main:app` on it
+and, for --duration seconds, concurrently runs:
+- voters: POST /polls/{id}/vote by random users on random polls
+- listers: GET /polls/
+- readers: GET /polls/{id}/results
+- a probe voting on one extra poll watched by --subscribers WebSockets,
+  timing how long each update takes to reach them (fan-out lag)
+
+Prints one JSON object per operation with throughput and p50/p95/p99
+latency, tagged with the git commit so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import httpx
+import websockets
+from sqlalchemy import create_engine, insert
+
+from app.auth.jwt import create_access_token, user_claims
+from app.db import Base
+from app.models import User, Poll, Option
+
+PROBE_INTERVAL = 0.05
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def latency_summary(samples) -> dict:
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        f"p{int(fraction * 100)}_ms": round(percentile(samples, fraction) * 1000, 3)
+        for fraction in (0.5, 0.95, 0.99)
+    }
+
+
+def seed(url: str, users: int, polls: int, options: int):
+    """Load users and polls; poll `polls + 1` is kept for the fan-out probe."""
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            # Nobody logs in, tokens are minted below
+            {"id": id, "email": f"user{id}@example.com", "name": f"User {id}", "password_hash": "!"}
+            for id in range(1, users + 1)
+        ])
+        connection.execute(insert(Poll), [
+            {"id": id, "title": f"Poll {id}", "description": "Benchmark poll", "owner_id": random.randint(1, users)}
+            for id in range(1, polls + 2)
+        ])
+        connection.execute(insert(Option), [
+            {"id": (poll_id - 1) * options + n, "poll_id": poll_id, "text": f"Option {n}"}
+            for poll_id in range(1, polls + 2)
+            for n in range(1, options + 1)
+        ])
+    engine.dispose()
+
+    created_at = datetime.now(timezone.utc)
+    return [
+        create_access_token(data=user_claims(SimpleNamespace(
+            id=id, email=f"user{id}@example.com", name=f"User {id}", created_at=created_at
+        )))
+        for id in range(1, users + 1)
+    ]
+
+
+def start_server(url: str, port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "DATABASE_URL": url},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, operation: str, call):
+        started = time.perf_counter()
+        try:
+            response = await call()
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            self.latencies.setdefault(operation, []).append(time.perf_counter() - started)
+        else:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+
+async def run(args, tokens, base_url: str) -> list:
+    recorder = Recorder()
+    hot_poll = args.polls + 1
+    probe_sent = {}
+    lags = []
+    deadline = time.perf_counter() + args.duration
+    limits = httpx.Limits(max_connections=args.voters + args.listers + args.readers + 1)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def voter():
+            while time.perf_counter() < deadline:
+                poll_id = random.randint(1, args.polls)
+                option_id = (poll_id - 1) * args.options + random.randint(1, args.options)
+                token = random.choice(tokens)
+                await recorder.request("vote", lambda: client.post(
+                    f"/polls/{poll_id}/vote", json={"option_id": option_id},
+                    headers={"Authorization": f"Bearer {token}"}
+                ))
+
+        async def lister():
+            while time.perf_counter() < deadline:
+                await recorder.request("list", lambda: client.get("/polls/", params={"limit": 20}))
+
+        async def reader():
+            while time.perf_counter() < deadline:
+                poll_id = random.randint(1, args.polls)
+                await recorder.request("results", lambda: client.get(f"/polls/{poll_id}/results"))
+
+        async def probe():
+            # One fresh voter per update, so the k-th update carries total_votes == k
+            option_id = (hot_poll - 1) * args.options + 1
+            for total_votes, token in enumerate(tokens, start=1):
+                if time.perf_counter() >= deadline:
+                    return
+                probe_sent[total_votes] = time.perf_counter()
+                await client.post(
+                    f"/polls/{hot_poll}/vote", json={"option_id": option_id},
+                    headers={"Authorization": f"Bearer {token}"}
+                )
+                await asyncio.sleep(PROBE_INTERVAL)
+
+        async def subscriber(websocket):
+            while True:
+                message = json.loads(await websocket.recv())
+                sent = probe_sent.get(message.get("total_votes"))
+                if sent is not None:
+                    lags.append(time.perf_counter() - sent)
+
+        ws_url = base_url.replace("http", "ws", 1) + f"/polls/ws/{hot_poll}"
+        sockets = [await websockets.connect(ws_url) for _ in range(args.subscribers)]
+        listeners = [asyncio.create_task(subscriber(websocket)) for websocket in sockets]
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(voter() for _ in range(args.voters)),
+            *(lister() for _ in range(args.listers)),
+            *(reader() for _ in range(args.readers)),
+            probe(),
+        )
+        elapsed = time.perf_counter() - started
+        # Let the last updates arrive
+        await asyncio.sleep(0.5)
+        for task in listeners:
+            task.cancel()
+        for websocket in sockets:
+            await websocket.close()
+
+    commit = git_commit()
+    results = []
+    for operation in ("vote", "list", "results"):
+        samples = recorder.latencies.get(operation, [])
+        results.append({
+            "benchmark": "load",
+            "commit": commit,
+            "operation": operation,
+            "requests": len(samples),
+            "errors": recorder.errors.get(operation, 0),
+            "throughput_rps": round(len(samples) / elapsed, 1),
+            **latency_summary(samples),
+        })
+    results.append({
+        "benchmark": "load",
+        "commit": commit,
+        "operation": "ws_fanout",
+        "subscribers": args.subscribers,
+        "updates": len(probe_sent),
+        "deliveries": len(lags),
+        "expected_deliveries": len(probe_sent) * args.subscribers,
+        **latency_summary(lags),
+    })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test votes, listings, results and WebSocket fan-out")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--voters", type=int, default=8)
+    parser.add_argument("--listers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database-url", default=None, help="scratch database (default: temporary SQLite file)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f"sqlite:///{os.path.join(directory, 'load_bench.db')}"
+        tokens = seed(url, args.users, args.polls, args.options)
+        server = start_server(url, args.port)
+        try:
+            results = asyncio.run(run(args, tokens, f"http://127.0.0.1:{args.port}"))
+        finally:
+            server.terminate()
+            server.wait()
+        for result in results:
+            print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
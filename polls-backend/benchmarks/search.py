@@ -0,0 +1,107 @@
+"""
+Poll search benchmark: indexed full-text search against the ILIKE scan it replaced.
+
+Usage:
+    python -m benchmarks.search [--sizes 10000 1000000] [--queries 50]
+                                [--database-url postgresql+psycopg2://...]
+
+Each size rebuilds the polls table in the target database (a scratch
+SQLite file by default; never point this at a database you care about),
+loads synthetic polls and times the listing query with both strategies,
+ordered like GET /polls/. Prints one JSON object per size.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+
+from app.db import Base
+from app.models import User, Poll
+from app.polls.search import apply_search
+
+BATCH_SIZE = 10000
+
+
+def make_vocabulary(rng: random.Random, size: int = 5000):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(size)]
+
+
+def load_polls(engine, size: int, vocabulary, rng: random.Random):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"id": 1, "email": "bench@example.com", "name": "Bench", "password_hash": "x"}])
+        for start in range(0, size, BATCH_SIZE):
+            connection.execute(insert(Poll), [
+                {
+                    "title": " ".join(rng.choices(vocabulary, k=4)),
+                    "description": " ".join(rng.choices(vocabulary, k=20)),
+                    "owner_id": 1,
+                }
+                for _ in range(min(BATCH_SIZE, size - start))
+            ])
+
+
+def time_query(connection, query, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        connection.execute(query).all()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run(engine, size: int, queries: int, rng: random.Random) -> dict:
+    vocabulary = make_vocabulary(rng)
+    load_polls(engine, size, vocabulary, rng)
+    terms = [word[:rng.randint(3, len(word))] for word in rng.sample(vocabulary, queries)]
+
+    listing = select(Poll.id).order_by(Poll.created_at.desc(), Poll.id.desc()).limit(10)
+    ilike_ms, indexed_ms = [], []
+    with engine.connect() as connection:
+        for term in terms:
+            ilike_ms.append(time_query(connection, listing.where(
+                Poll.title.ilike(f"%{term}%") | Poll.description.ilike(f"%{term}%")
+            )))
+            indexed_ms.append(time_query(connection, apply_search(listing, term, engine.dialect.name)))
+
+    return {
+        "benchmark": "search",
+        "dialect": engine.dialect.name,
+        "polls": size,
+        "queries": queries,
+        "ilike_p50_ms": round(statistics.median(ilike_ms), 3),
+        "ilike_max_ms": round(max(ilike_ms), 3),
+        "indexed_p50_ms": round(statistics.median(indexed_ms), 3),
+        "indexed_max_ms": round(max(indexed_ms), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark poll search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--database-url", default=None, help="scratch database (default: temporary SQLite file)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f"sqlite:///{os.path.join(directory, 'search_bench.db')}"
+        engine = create_engine(url)
+        rng = random.Random(args.seed)
+        try:
+            for size in args.sizes:
+                print(json.dumps(run(engine, size, args.queries, rng)), flush=True)
+        finally:
+            Base.metadata.drop_all(bind=engine)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Per-request CPU of the poll listing and results responses, with and without FAST_JSON_RESPONSES.
+
+Usage:
+    python -m benchmarks.serialization [--limit 100] [--options 4] [--requests 500]
+
+Runs the app in-process over ASGI against a temporary SQLite file seeded
+with one page of polls, and measures process CPU time per request, so the
+database work is included but no network or client wait is. Each route is
+timed with the default response path and with the orjson fast path; one
+JSON object is printed per route and mode. A last pair of lines times
+only the encoding of the listing page, which is the part the fast path
+changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.db import Base, get_db
+from app.main import app
+from app.models import Option, Poll, User
+from app.polls.cache import results_cache
+from app.polls.service import PollsService
+from app.responses import FastJSONResponse
+from app.schemas import PollListResponse
+
+
+def seed(engine, polls: int, options: int) -> int:
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"email": "owner@example.com", "name": "Owner", "password_hash": "x"}])
+        connection.execute(insert(Poll), [
+            {
+                "title": f"Benchmark poll {i}",
+                "description": "A poll with a description of typical length for the listing page",
+                "owner_id": 1,
+                "total_votes": options * 10,
+            }
+            for i in range(polls)
+        ])
+        poll_ids = connection.execute(select(Poll.id)).scalars().all()
+        connection.execute(insert(Option), [
+            {"poll_id": poll_id, "text": f"Option {j}", "votes_count": 10}
+            for poll_id in poll_ids
+            for j in range(options)
+        ])
+    return poll_ids[0]
+
+
+async def measure(path: str, params: dict, requests: int) -> dict:
+    """Per-request CPU by mode; the modes alternate so drift hits both alike."""
+    cpu = {False: [], True: []}
+    sizes = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up the caches and code paths
+        for _ in range(10):
+            (await client.get(path, params=params)).raise_for_status()
+
+        for i in range(requests * 2):
+            fast = bool(i % 2)
+            settings.fast_json_responses = fast
+            started = time.process_time()
+            response = await client.get(path, params=params)
+            cpu[fast].append(time.process_time() - started)
+            response.raise_for_status()
+            sizes[fast] = len(response.content)
+
+    return {
+        "fast" if fast else "default": {
+            "cpu_us_mean": round(statistics.fmean(samples) * 1e6, 1),
+            "cpu_us_p50": round(statistics.median(samples) * 1e6, 1),
+            "response_bytes": sizes[fast],
+        }
+        for fast, samples in cpu.items()
+    }
+
+
+async def measure_encoding(page: list, requests: int) -> dict:
+    """CPU to turn a listing page into a response body, as each path does it."""
+    field = create_response_field(name="response", type_=list[PollListResponse])
+
+    async def default():
+        content = await serialize_response(field=field, response_content=page)
+        return JSONResponse(content).body
+
+    async def fast():
+        return FastJSONResponse(page).body
+
+    results = {}
+    for mode, encode in (("default", default), ("fast", fast)):
+        started = time.process_time()
+        for _ in range(requests):
+            await encode()
+        results[mode] = round((time.process_time() - started) / requests * 1e6, 1)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare per-request CPU of the default and orjson response paths")
+    parser.add_argument("--limit", type=int, default=100, help="page size of the listing")
+    parser.add_argument("--options", type=int, default=4, help="options per poll")
+    parser.add_argument("--requests", type=int, default=500, help="timed requests per route and mode")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'serialization_bench.db')}")
+        SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+        def bench_get_db():
+            db = SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = bench_get_db
+        Base.metadata.create_all(bind=engine)
+        poll_id = seed(engine, args.limit, args.options)
+        results_cache.clear()
+
+        routes = [
+            ("/polls/", {"limit": args.limit}),
+            (f"/polls/{poll_id}/results", {}),
+        ]
+        default = settings.fast_json_responses
+        try:
+            for path, params in routes:
+                for mode, result in asyncio.run(measure(path, params, args.requests)).items():
+                    print(json.dumps({
+                        "benchmark": "serialization",
+                        "route": path.replace(str(poll_id), "{poll_id}"),
+                        "limit": args.limit if params else None,
+                        "mode": mode,
+                        **result,
+                    }), flush=True)
+
+            with SessionLocal() as db:
+                page = PollsService(db).get_polls(limit=args.limit)
+            for mode, cpu_us in asyncio.run(measure_encoding(page, args.requests)).items():
+                print(json.dumps({
+                    "benchmark": "serialization",
+                    "route": "encode only",
+                    "limit": args.limit,
+                    "mode": mode,
+                    "cpu_us_mean": cpu_us,
+                }), flush=True)
+        finally:
+            settings.fast_json_responses = default
+            app.dependency_overrides.pop(get_db, None)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Broadcast benchmark for ConnectionManager with in-process fake sockets.
+
+Usage:
+    python -m benchmarks.ws_broadcast [--sizes 1000 10000] [--rounds 5] [--send-delay 0]
+
+For every subscriber count it reports, as one JSON object per line:
+- broadcast_ms: time the voter's request spends in broadcast_to_poll
+- fanout_ms: time until every subscriber received the message
+- sequential_ms: the previous implementation (json.dumps + awaited
+  send_text per connection) for comparison
+
+A second line per subscriber count reports the memory the manager holds
+per idle connection and per subscription, as traced by tracemalloc; these
+are the figures behind CONNECTION_BYTES and SUBSCRIPTION_BYTES in
+app.polls.ws.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+
+from app.polls.ws import ConnectionManager
+from app.schemas import PollUpdateMessage
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay: float, received: asyncio.Queue):
+        self.send_delay = send_delay
+        self.received = received
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        await asyncio.sleep(self.send_delay)
+        self.received.put_nowait(data)
+
+
+async def sequential_broadcast(sockets, message: PollUpdateMessage):
+    for websocket in sockets:
+        await websocket.send_text(json.dumps(message.model_dump()))
+
+
+async def run(size: int, rounds: int, send_delay: float) -> dict:
+    received: asyncio.Queue = asyncio.Queue()
+    manager = ConnectionManager(queue_size=rounds + 1, max_connections=size, max_connections_per_poll=size)
+    sockets = [FakeWebSocket(send_delay, received) for _ in range(size)]
+    for websocket in sockets:
+        await manager.connect(websocket, 1)
+
+    broadcast_ms, fanout_ms, sequential_ms = [], [], []
+    for votes_count in range(1, rounds + 1):
+        message = PollUpdateMessage(option_id=1, votes_count=votes_count, total_votes=votes_count, poll_id=1)
+
+        started = time.perf_counter()
+        await manager.broadcast_to_poll(1, message)
+        broadcast_ms.append((time.perf_counter() - started) * 1000)
+        for _ in range(size):
+            await received.get()
+        fanout_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await sequential_broadcast(sockets, message)
+        sequential_ms.append((time.perf_counter() - started) * 1000)
+        while not received.empty():
+            received.get_nowait()
+
+    for websocket in sockets:
+        manager.disconnect(websocket)
+
+    return {
+        "benchmark": "ws_broadcast",
+        "subscribers": size,
+        "rounds": rounds,
+        "send_delay_ms": send_delay * 1000,
+        "broadcast_ms": round(statistics.median(broadcast_ms), 3),
+        "fanout_ms": round(statistics.median(fanout_ms), 3),
+        "sequential_ms": round(statistics.median(sequential_ms), 3),
+        "skipped_messages": manager.skipped_messages,
+    }
+
+
+async def measure_memory(size: int, polls: int) -> dict:
+    received: asyncio.Queue = asyncio.Queue()
+    manager = ConnectionManager(max_connections=size + 1)
+    # The sockets belong to the server and are created before tracing
+    sockets = [FakeWebSocket(0.0, received) for _ in range(size)]
+    # Let the queues' and tasks' lazily created state exist before tracing
+    await manager.connect(FakeWebSocket(0.0, received), 0)
+    await asyncio.sleep(0)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clients = [await manager.connect(websocket) for websocket in sockets]
+    # The writer tasks start and wait on their queues
+    await asyncio.sleep(0)
+    connected = tracemalloc.get_traced_memory()[0]
+    for client in clients:
+        await manager.subscribe(client, range(1, polls + 1))
+    subscribed = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    for websocket in sockets:
+        manager.disconnect(websocket)
+    return {
+        "benchmark": "ws_memory",
+        "connections": size,
+        "connection_bytes": round((connected - before) / size),
+        "subscription_bytes": round((subscribed - connected) / (size * polls)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark WebSocket broadcast fan-out")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--send-delay", type=float, default=0.0, help="simulated seconds per send")
+    parser.add_argument("--memory-polls", type=int, default=10, help="subscriptions per connection when measuring memory")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(json.dumps(asyncio.run(run(size, args.rounds, args.send_delay))))
+        print(json.dumps(asyncio.run(measure_memory(size, args.memory_polls))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Denormalized vote counts
+
+Revision ID: 002
+Revises: 001
+Create Date: 2024-02-01 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('options', sa.Column('votes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('polls', sa.Column('total_votes', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the counters from the existing votes
+    op.execute("""
+        UPDATE options SET votes_count = (
+            SELECT COUNT(votes.id) FROM votes WHERE votes.option_id = options.id
+        )
+    """)
+    op.execute("""
+        UPDATE polls SET total_votes = (
+            SELECT COALESCE(SUM(options.votes_count), 0) FROM options WHERE options.poll_id = polls.id
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('polls', 'total_votes')
+    op.drop_column('options', 'votes_count')
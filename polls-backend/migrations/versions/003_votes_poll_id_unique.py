@@ -0,0 +1,58 @@
+"""Store poll_id on votes with a unique (user_id, poll_id) constraint
+
+Revision ID: 003
+Revises: 002
+Create Date: 2024-02-15 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('votes', sa.Column('poll_id', sa.Integer(), nullable=True))
+    op.add_column('votes', sa.Column('previous_option_id', sa.Integer(), nullable=True))
+
+    op.execute("""
+        UPDATE votes SET poll_id = (
+            SELECT options.poll_id FROM options WHERE options.id = votes.option_id
+        )
+    """)
+
+    # Uniqueness used to be checked by the application only; keep the latest
+    # vote per user and poll before the constraint is added
+    op.execute("""
+        DELETE FROM votes WHERE id NOT IN (
+            SELECT MAX(id) FROM votes GROUP BY user_id, poll_id
+        )
+    """)
+    op.execute("""
+        UPDATE options SET votes_count = (
+            SELECT COUNT(votes.id) FROM votes WHERE votes.option_id = options.id
+        )
+    """)
+    op.execute("""
+        UPDATE polls SET total_votes = (
+            SELECT COUNT(votes.id) FROM votes WHERE votes.poll_id = polls.id
+        )
+    """)
+
+    op.alter_column('votes', 'poll_id', nullable=False)
+    op.create_foreign_key('votes_poll_id_fkey', 'votes', 'polls', ['poll_id'], ['id'])
+    op.create_index(op.f('ix_votes_poll_id'), 'votes', ['poll_id'], unique=False)
+    op.create_unique_constraint('uq_votes_user_poll', 'votes', ['user_id', 'poll_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_votes_user_poll', 'votes', type_='unique')
+    op.drop_index(op.f('ix_votes_poll_id'), table_name='votes')
+    op.drop_constraint('votes_poll_id_fkey', 'votes', type_='foreignkey')
+    op.drop_column('votes', 'previous_option_id')
+    op.drop_column('votes', 'poll_id')
@@ -0,0 +1,26 @@
+"""Keyset pagination indexes on polls
+
+Revision ID: 004
+Revises: 003
+Create Date: 2024-03-01 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_polls_created_at_id', 'polls', [sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_polls_owner_id_created_at_id', 'polls', ['owner_id', sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_polls_owner_id_created_at_id', table_name='polls')
+    op.drop_index('ix_polls_created_at_id', table_name='polls')
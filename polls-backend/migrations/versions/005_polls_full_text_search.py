@@ -0,0 +1,31 @@
+"""Full-text search vector on polls
+
+Revision ID: 005
+Revises: 004
+Create Date: 2024-03-15 00:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Generated column, so PostgreSQL computes it for existing and new polls
+    op.execute("""
+        ALTER TABLE polls ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED
+    """)
+    op.create_index('ix_polls_search_vector', 'polls', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_polls_search_vector', table_name='polls')
+    op.drop_column('polls', 'search_vector')
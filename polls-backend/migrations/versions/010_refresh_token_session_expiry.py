@@ -0,0 +1,28 @@
+"""Absolute session expiry on refresh tokens
+
+Revision ID: 010
+Revises: 009
+Create Date: 2024-06-01 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('refresh_tokens', sa.Column('session_expires_at', sa.DateTime(timezone=True), nullable=True))
+    # Existing sessions end when their current token does
+    op.execute("UPDATE refresh_tokens SET session_expires_at = expires_at")
+    with op.batch_alter_table('refresh_tokens') as batch_op:
+        batch_op.alter_column('session_expires_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+
+
+def downgrade() -> None:
+    op.drop_column('refresh_tokens', 'session_expires_at')
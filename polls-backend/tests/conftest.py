@@ -0,0 +1,4 @@
+import os
+
+# Cheap bcrypt rounds keep the suite fast; must be set before app.config loads
+os.environ.setdefault("PASSWORD_BCRYPT_ROUNDS", "4")
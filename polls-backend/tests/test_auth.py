@@ -1,11 +1,17 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.db import get_db, Base
-from app.models import User
-from app.auth.hashing import get_password_hash
+from app.models import User, RefreshToken
+from app.auth.hashing import PasswordHasher, get_password_hash
+from app.config import settings
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -104,3 +110,164 @@ def test_get_current_user(setup_database):
     assert data["email"] == "test@example.com"
     assert data["name"] == "Test User"
 
+def login_token():
+    client.post("/auth/register", json={
+        "email": "test@example.com",
+        "name": "Test User",
+        "password": "testpassword123"
+    })
+    response = client.post("/auth/login", json={
+        "email": "test@example.com",
+        "password": "testpassword123"
+    })
+    return response.json()["access_token"]
+
+def test_current_user_from_token_claims_skips_database(setup_database):
+    token = login_token()
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    # Every engine, since test modules override get_db with their own
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        for _ in range(2):
+            response = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200
+            assert response.json()["email"] == "test@example.com"
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+    assert statements == []
+
+def test_logout_revokes_token(setup_database, monkeypatch):
+    monkeypatch.setattr(settings, "auth_revocation_check", True)
+    token = login_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    
+    assert client.post("/auth/logout", headers=headers).status_code == 204
+    
+    response = client.get("/auth/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+    # Other tokens of the same user stay valid
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {login_token()}"}).status_code == 200
+
+def test_refresh_rotates_token(setup_database):
+    client.post("/auth/register", json={
+        "email": "test@example.com",
+        "name": "Test User",
+        "password": "testpassword123"
+    })
+    login_response = client.post("/auth/login", json={
+        "email": "test@example.com",
+        "password": "testpassword123"
+    })
+    refresh_token = login_response.json()["refresh_token"]
+    
+    response = client.post("/auth/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["refresh_token"] != refresh_token
+    me = client.get("/auth/me", headers={"Authorization": f"Bearer {data['access_token']}"})
+    assert me.json()["email"] == "test@example.com"
+    
+    # The used token was rotated out
+    assert client.post("/auth/refresh", json={"refresh_token": refresh_token}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": data["refresh_token"]}).status_code == 200
+
+def test_refresh_is_a_single_statement(setup_database):
+    client.post("/auth/register", json={
+        "email": "test@example.com",
+        "name": "Test User",
+        "password": "testpassword123"
+    })
+    login_response = client.post("/auth/login", json={
+        "email": "test@example.com",
+        "password": "testpassword123"
+    })
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.post("/auth/refresh", json={"refresh_token": login_response.json()["refresh_token"]})
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE refresh_tokens")
+
+def test_refresh_does_not_outlive_the_session(setup_database):
+    register_response = client.post("/auth/register", json={
+        "email": "test@example.com",
+        "name": "Test User",
+        "password": "testpassword123"
+    })
+    session_expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    db = TestingSessionLocal()
+    stored = db.query(RefreshToken).one()
+    stored.session_expires_at = session_expires_at
+    db.commit()
+    
+    # Rotations keep the session's expiry rather than extending it
+    response = client.post("/auth/refresh", json={"refresh_token": register_response.json()["refresh_token"]})
+    assert response.status_code == 200
+    db.expire_all()
+    stored = db.query(RefreshToken).one()
+    assert stored.expires_at.replace(tzinfo=timezone.utc) == session_expires_at
+    
+    # and stop once it has passed
+    stored.session_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+    db.close()
+    response = client.post("/auth/refresh", json={"refresh_token": response.json()["refresh_token"]})
+    assert response.status_code == 401
+
+def test_refresh_rejects_unknown_token(setup_database):
+    response = client.post("/auth/refresh", json={"refresh_token": "not-a-token"})
+    assert response.status_code == 401
+
+def test_legacy_password_is_rehashed_on_login(setup_database):
+    salt = "a" * 32
+    legacy_hash = f"{salt}${hashlib.sha256((salt + 'legacypassword').encode('utf-8')).hexdigest()}"
+    db = TestingSessionLocal()
+    db.add(User(email="legacy@example.com", name="Legacy User", password_hash=legacy_hash))
+    db.commit()
+    
+    response = client.post("/auth/login", json={
+        "email": "legacy@example.com",
+        "password": "legacypassword"
+    })
+    assert response.status_code == 200
+    
+    db.expire_all()
+    user = db.query(User).filter(User.email == "legacy@example.com").one()
+    assert user.password_hash.startswith("$2b$")
+    db.close()
+    
+    # The upgraded hash keeps working
+    response = client.post("/auth/login", json={
+        "email": "legacy@example.com",
+        "password": "legacypassword"
+    })
+    assert response.status_code == 200
+
+def test_password_hasher_rejects_beyond_queue_limit():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    
+    async def scenario():
+        return await asyncio.gather(
+            *(hasher.hash("password") for _ in range(3)),
+            return_exceptions=True
+        )
+    
+    results = asyncio.run(scenario())
+    hasher.shutdown()
+    assert [isinstance(result, str) for result in results] == [True, True, False]
+    assert isinstance(results[2], HTTPException) and results[2].status_code == 503
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["queue_depth"] == 0
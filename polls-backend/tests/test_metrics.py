@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.db import get_db, Base
+from app.metrics import Counter, Gauge, HistogramMetric, Registry
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+client = TestClient(app)
+
+@pytest.fixture(scope="function")
+def setup_database():
+    previous_override = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    app.dependency_overrides[get_db] = previous_override
+
+def sample(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests.", ("route",)))
+    in_flight = registry.register(Gauge("in_flight", "In flight."))
+    latency = registry.register(HistogramMetric("latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    requests.inc('/a"b')
+    in_flight.inc()
+    latency.observe(value=0.5)
+    
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a\\"b"} 1',
+        "# HELP in_flight In flight.",
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 0',
+        'latency_seconds_bucket{le="1.0"} 1',
+        'latency_seconds_bucket{le="+Inf"} 1',
+        "latency_seconds_sum 0.5",
+        "latency_seconds_count 1",
+    ]
+
+def test_metrics_record_routes_and_sql(setup_database):
+    before = client.get("/metrics").text
+    registered = sample(before, 'http_requests_total{method="POST",route="/auth/register",status="201"}') or 0
+    
+    response = client.post("/auth/register", json={
+        "email": "metrics@example.com",
+        "name": "Metrics User",
+        "password": "testpassword123"
+    })
+    assert response.status_code == 201
+    assert client.get("/polls/999").status_code == 404
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert sample(text, 'http_requests_total{method="POST",route="/auth/register",status="201"}') == registered + 1
+    # Labelled by route template, not by path
+    assert sample(text, 'http_requests_total{method="GET",route="/polls/{poll_id}",status="404"}') >= 1
+    assert sample(text, 'http_request_sql_statements_sum{method="POST",route="/auth/register"}') > 0
+    assert sample(text, "http_requests_in_flight") == 1
+    assert "# TYPE ws_connections gauge" in text
+    assert "# TYPE db_pool_wait_seconds histogram" in text
+    assert "# TYPE results_cache_hits_total counter" in text
+    assert "# TYPE password_hash_queue_depth gauge" in text
@@ -1,11 +1,24 @@
+import asyncio
+import json
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.db import get_db, Base
-from app.models import User, Poll, Option
+from app.models import User, Poll, Option, Vote, OutboxMessage
 from app.auth.hashing import get_password_hash
+from app.polls import reconcile
+from app.polls.reconcile import reconcile_vote_counts
+from app.polls.buffer import VoteBuffer
+from app.polls.outbox import OutboxDispatcher
+from app.polls.service import PollsService
+from app.polls.ws import ConnectionManager, manager
+from app.schemas import PollUpdateMessage
+from app.polls.cache import ResultsCache, results_cache
+from app.config import settings
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -26,6 +39,7 @@ client = TestClient(app)
 @pytest.fixture(scope="function")
 def setup_database():
     Base.metadata.create_all(bind=engine)
+    results_cache.clear()
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -121,3 +135,658 @@ def test_get_poll_results(auth_headers):
     assert "total_votes" in data
     assert len(data["options"]) == 2
 
+
+def count_queries(fn):
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements)
+
+def test_list_polls_query_count_is_constant(auth_headers):
+    def create_polls(count):
+        for i in range(count):
+            create_response = client.post("/polls/", json={
+                "title": f"Poll {i}",
+                "description": "Listing test poll",
+                "options": ["Option 1", "Option 2", "Option 3"]
+            }, headers=auth_headers)
+            poll = create_response.json()
+            client.post(f"/polls/{poll['id']}/vote", json={
+                "option_id": poll["options"][1]["id"]
+            }, headers=auth_headers)
+    
+    create_polls(2)
+    small_page = count_queries(lambda: client.get("/polls/?limit=100", headers=auth_headers))
+    
+    create_polls(20)
+    large_page = count_queries(lambda: client.get("/polls/?limit=100", headers=auth_headers))
+    
+    assert small_page == large_page
+    
+    response = client.get("/polls/?limit=100", headers=auth_headers)
+    polls = response.json()
+    assert len(polls) == 22
+    for poll in polls:
+        assert poll["total_votes"] == 1
+        assert poll["hasVoted"] is True
+        assert poll["userVote"] == poll["options"][1]["id"]
+        assert [option["votes_count"] for option in poll["options"]] == [0, 1, 0]
+    
+    my_polls = count_queries(lambda: client.get("/polls/me?limit=100", headers=auth_headers))
+    assert my_polls == large_page
+
+def test_change_vote_moves_counts(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": first_id}, headers=auth_headers)
+    response = client.post(f"/polls/{poll_id}/vote", json={"option_id": second_id}, headers=auth_headers)
+    
+    assert response.status_code == 200
+    assert response.json() == {"option_id": second_id, "votes_count": 1, "total_votes": 1}
+    
+    results = client.get(f"/polls/{poll_id}/results").json()
+    assert [option["votes_count"] for option in results["options"]] == [0, 1]
+    assert results["total_votes"] == 1
+
+def test_reconcile_vote_counts(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    
+    poll_id = create_response.json()["id"]
+    option_id = create_response.json()["options"][0]["id"]
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": option_id}, headers=auth_headers)
+    
+    db = TestingSessionLocal()
+    try:
+        assert reconcile_vote_counts(db) == []
+        
+        db.execute(update(Option).where(Option.id == option_id).values(votes_count=5))
+        db.execute(update(Poll).where(Poll.id == poll_id).values(total_votes=7))
+        db.commit()
+        
+        drift = reconcile_vote_counts(db, fix=True)
+        assert {(item.table, item.stored, item.actual) for item in drift} == {
+            ("options", 5, 1),
+            ("polls", 7, 1),
+        }
+        assert reconcile_vote_counts(db) == []
+    finally:
+        db.close()
+
+def test_reconcile_keeps_votes_cast_after_the_scan(auth_headers, monkeypatch):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    option_id = create_response.json()["options"][0]["id"]
+    voter_id = create_voters(1)[0]
+    
+    scan = reconcile.find_vote_count_drift
+    
+    def scan_then_vote(db):
+        drift = scan(db)
+        db.add(Vote(user_id=voter_id, poll_id=poll_id, option_id=option_id))
+        db.flush()
+        return drift
+    
+    db = TestingSessionLocal()
+    try:
+        db.execute(update(Option).where(Option.id == option_id).values(votes_count=5))
+        db.commit()
+        monkeypatch.setattr(reconcile, "find_vote_count_drift", scan_then_vote)
+        reconcile_vote_counts(db, fix=True)
+        
+        db.expire_all()
+        assert db.get(Option, option_id).votes_count == 1
+    finally:
+        db.close()
+
+def test_reconcile_moves_fixed_polls_to_a_new_version(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    option_id = create_response.json()["options"][0]["id"]
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": option_id}, headers=auth_headers)
+    
+    db = TestingSessionLocal()
+    try:
+        db.execute(update(Option).where(Option.id == option_id).values(votes_count=5))
+        db.commit()
+        results_cache.clear()
+        # Cached and tagged with the drifted count
+        response = client.get(f"/polls/{poll_id}/results")
+        assert response.json()["options"][0]["votes_count"] == 5
+        etag = response.headers["etag"]
+        
+        # Fixed by another process, whose cache is not this worker's
+        reconcile_vote_counts(db, fix=True, cache=ResultsCache(capacity=8, ttl_seconds=60))
+    finally:
+        db.close()
+    
+    response = client.get(f"/polls/{poll_id}/results", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["options"][0]["votes_count"] == 1
+
+def test_vote_statement_count(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    user_id = client.get("/auth/me", headers=auth_headers).json()["id"]
+    
+    db = TestingSessionLocal()
+    try:
+        polls_service = PollsService(db)
+        # Upsert, counters and results version (SQLite cannot chain the
+        # option and poll updates), plus the outbox row of a changed vote
+        assert count_queries(lambda: polls_service.vote_on_poll(poll_id, first_id, user_id)) == 4
+        assert count_queries(lambda: polls_service.vote_on_poll(poll_id, second_id, user_id)) == 4
+        assert count_queries(lambda: polls_service.vote_on_poll(poll_id, second_id, user_id)) == 2
+        
+        assert db.query(Vote).filter(Vote.poll_id == poll_id).count() == 1
+        assert db.get(Option, second_id).votes_count == 1
+        assert db.get(Poll, poll_id).total_votes == 1
+        # One version per option changed: the new vote, then both options of the move
+        assert db.get(Poll, poll_id).results_version == 3
+    finally:
+        db.close()
+
+def test_vote_rejects_option_from_another_poll(auth_headers):
+    polls = [
+        client.post("/polls/", json={
+            "title": f"Poll {i}",
+            "description": "This is a test poll",
+            "options": ["Option 1", "Option 2"]
+        }, headers=auth_headers).json()
+        for i in range(2)
+    ]
+    
+    response = client.post(f"/polls/{polls[0]['id']}/vote", json={
+        "option_id": polls[1]["options"][0]["id"]
+    }, headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.post("/polls/9999/vote", json={
+        "option_id": polls[1]["options"][0]["id"]
+    }, headers=auth_headers)
+    assert response.status_code == 404
+
+def test_one_vote_per_user_per_poll_is_enforced(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    
+    poll = create_response.json()
+    user_id = client.get("/auth/me", headers=auth_headers).json()["id"]
+    
+    db = TestingSessionLocal()
+    try:
+        for option in poll["options"]:
+            db.add(Vote(user_id=user_id, poll_id=poll["id"], option_id=option["id"]))
+        with pytest.raises(IntegrityError):
+            db.commit()
+    finally:
+        db.close()
+
+def test_poll_results_are_cached_and_updated_by_votes(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    
+    client.get(f"/polls/{poll_id}/results")
+    before = results_cache.stats()
+    
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": first_id}, headers=auth_headers)
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": second_id}, headers=auth_headers)
+    
+    results = client.get(f"/polls/{poll_id}/results", headers=auth_headers).json()
+    assert [option["votes_count"] for option in results["options"]] == [0, 1]
+    assert results["total_votes"] == 1
+    assert results["hasVoted"] is True
+    assert results["userVote"] == second_id
+    
+    anonymous = client.get(f"/polls/{poll_id}").json()
+    assert anonymous["hasVoted"] is False
+    assert anonymous["userVote"] is None
+    
+    after = results_cache.stats()
+    assert after["hits"] - before["hits"] == 2
+    assert after["misses"] == before["misses"]
+
+def test_cursor_pagination(auth_headers):
+    for i in range(5):
+        client.post("/polls/", json={
+            "title": f"Poll {i}",
+            "description": "Pagination test poll",
+            "options": ["Option 1", "Option 2"]
+        }, headers=auth_headers)
+    
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/polls/", params=params)
+        assert response.status_code == 200
+        seen.extend(poll["title"] for poll in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    
+    # Newest first, every poll exactly once
+    assert seen == [f"Poll {i}" for i in reversed(range(5))]
+    
+    skipped = client.get("/polls/", params={"skip": 2, "limit": 2}).json()
+    assert [poll["title"] for poll in skipped] == ["Poll 2", "Poll 1"]
+    
+    assert client.get("/polls/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_cursor_pagination_across_timestamp_formats(auth_headers):
+    for i in range(2):
+        client.post("/polls/", json={
+            "title": f"Poll {i}",
+            "description": "Pagination test poll",
+            "options": ["Option 1", "Option 2"]
+        }, headers=auth_headers)
+    # The later poll sorts first as text but second as a time
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE polls SET created_at = '2024-01-01T11:00:00' WHERE title = 'Poll 0'"))
+        connection.execute(text("UPDATE polls SET created_at = '2024-01-01 12:00:00' WHERE title = 'Poll 1'"))
+    
+    first = client.get("/polls/", params={"limit": 1})
+    second = client.get("/polls/", params={"limit": 1, "cursor": first.headers["X-Next-Cursor"]})
+    assert [poll["title"] for poll in first.json() + second.json()] == ["Poll 1", "Poll 0"]
+
+def test_search_polls(auth_headers):
+    for title, description in [
+        ("Favourite programming language", "Pick the language you enjoy most"),
+        ("Best pizza topping", "Cheese, mushrooms or something else"),
+        ("Lunch options", "Where should we eat? Pizza, sushi or programming snacks"),
+    ]:
+        client.post("/polls/", json={
+            "title": title,
+            "description": description,
+            "options": ["Option 1", "Option 2"]
+        }, headers=auth_headers)
+    
+    # Prefix matching, with title matches ranked first
+    titles = [poll["title"] for poll in client.get("/polls/", params={"search": "progr"}).json()]
+    assert titles == ["Favourite programming language", "Lunch options"]
+    
+    titles = [poll["title"] for poll in client.get("/polls/", params={"search": "pizza top"}).json()]
+    assert titles == ["Best pizza topping"]
+    
+    titles = [poll["title"] for poll in client.get("/polls/me", params={"search": "sushi"}, headers=auth_headers).json()]
+    assert titles == ["Lunch options"]
+    
+    assert client.get("/polls/", params={"search": "?!"}).json() == []
+
+def test_results_etag_and_not_modified(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    option_id = create_response.json()["options"][0]["id"]
+    
+    response = client.get(f"/polls/{poll_id}/results")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"].startswith("public")
+    
+    def conditional_get():
+        return client.get(f"/polls/{poll_id}/results", headers={"If-None-Match": etag})
+    
+    # One version lookup answers an unchanged poll
+    responses = []
+    assert count_queries(lambda: responses.append(conditional_get())) == 1
+    assert responses[0].status_code == 304
+    assert responses[0].content == b""
+    assert responses[0].headers["etag"] == etag
+    
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": option_id}, headers=auth_headers)
+    
+    response = conditional_get()
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["total_votes"] == 1
+    
+    # Viewers get their own tag and a private response
+    response = client.get(f"/polls/{poll_id}", headers=auth_headers)
+    assert response.headers["etag"] != conditional_get().headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+def test_fast_json_responses_match_default(auth_headers, monkeypatch):
+    for i in range(3):
+        create_response = client.post("/polls/", json={
+            "title": f"Poll {i}",
+            "description": "Serialization test poll",
+            "options": ["Option 1", "Option 2"]
+        }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": create_response.json()["options"][1]["id"]}, headers=auth_headers)
+    
+    requests = [
+        ("/polls/", {"limit": 2}),
+        ("/polls/me", {"limit": 2}),
+        (f"/polls/{poll_id}", {}),
+        (f"/polls/{poll_id}/results", {}),
+    ]
+    
+    def fetch(fast):
+        monkeypatch.setattr(settings, "fast_json_responses", fast)
+        return [client.get(path, params=params, headers=auth_headers) for path, params in requests]
+    
+    for default, fast in zip(fetch(False), fetch(True)):
+        assert fast.status_code == 200
+        assert fast.headers["content-type"] == "application/json"
+        assert fast.json() == default.json()
+        for header in ("x-next-cursor", "etag", "cache-control"):
+            assert fast.headers.get(header) == default.headers.get(header)
+    
+    assert fetch(True)[0].headers["x-next-cursor"]
+
+def test_votes_are_published_through_the_outbox(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    
+    for option_id in (first_id, second_id, second_id):
+        assert client.post(f"/polls/{poll_id}/vote", json={"option_id": option_id}, headers=auth_headers).status_code == 200
+    
+    published = []
+    
+    async def publish(message):
+        published.append(message)
+    
+    async def drain():
+        dispatcher = OutboxDispatcher(publish, session_factory=TestingSessionLocal, batch_size=1)
+        return [await dispatcher.drain() for _ in range(4)]
+    
+    # The move left a message per option; the repeated vote changed nothing and left none
+    assert asyncio.run(drain()) == [1, 1, 1, 0]
+    assert [(message.option_id, message.votes_count, message.total_votes) for message in published] == [
+        (first_id, 1, 1), (first_id, 0, 1), (second_id, 1, 1)
+    ]
+    
+    db = TestingSessionLocal()
+    try:
+        assert db.query(OutboxMessage).count() == 0
+    finally:
+        db.close()
+
+def test_outbox_keeps_messages_that_failed_to_publish(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": create_response.json()["options"][0]["id"]}, headers=auth_headers)
+    
+    async def publish(message):
+        raise ConnectionError("broker unavailable")
+    
+    dispatcher = OutboxDispatcher(publish, session_factory=TestingSessionLocal)
+    with pytest.raises(ConnectionError):
+        asyncio.run(dispatcher.drain())
+    
+    db = TestingSessionLocal()
+    try:
+        assert db.query(OutboxMessage).count() == 1
+    finally:
+        db.close()
+
+def create_voters(count):
+    db = TestingSessionLocal()
+    try:
+        voters = [User(email=f"voter{i}@example.com", name=f"Voter {i}", password_hash="x") for i in range(count)]
+        db.add_all(voters)
+        db.commit()
+        return [voter.id for voter in voters]
+    finally:
+        db.close()
+
+def test_cast_votes_applies_a_batch_in_constant_statements(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    voters = create_voters(40)
+    
+    db = TestingSessionLocal()
+    try:
+        polls_service = PollsService(db)
+        # Options, users, upsert, both counters and the outbox, whatever the size
+        votes = {(user_id, poll_id): first_id for user_id in voters[:10]}
+        assert count_queries(lambda: polls_service.cast_votes(votes)) == 6
+        votes = {(user_id, poll_id): second_id for user_id in voters}
+        votes[(voters[0], poll_id + 1)] = first_id  # option of another poll
+        votes[(10 ** 6, poll_id)] = first_id  # unknown user
+        assert count_queries(lambda: polls_service.cast_votes(votes)) == 6
+        
+        db.expire_all()
+        assert db.get(Option, first_id).votes_count == 0
+        assert db.get(Option, second_id).votes_count == 40
+        assert db.get(Poll, poll_id).total_votes == 40
+        # One seq per changed option
+        assert db.get(Poll, poll_id).results_version == 3
+        assert reconcile_vote_counts(db) == []
+        
+        # Both options changed by the second batch are broadcast with their final counts
+        payloads = [message.payload for message in db.query(OutboxMessage).order_by(OutboxMessage.id)]
+        assert [json.loads(payload) for payload in payloads[-2:]] == [
+            {"option_id": first_id, "votes_count": 0, "total_votes": 40, "poll_id": poll_id, "seq": 2},
+            {"option_id": second_id, "votes_count": 40, "total_votes": 40, "poll_id": poll_id, "seq": 3},
+        ]
+        
+        # Moves only
+        votes = {(user_id, poll_id): first_id for user_id in voters[:5]}
+        polls_service.cast_votes(votes)
+        db.expire_all()
+        assert db.get(Option, first_id).votes_count == 5
+        assert db.get(Poll, poll_id).total_votes == 40
+    finally:
+        db.close()
+
+def test_vote_buffer_keeps_the_last_vote_of_each_user(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    voters = create_voters(3)
+    
+    buffer = VoteBuffer(session_factory=TestingSessionLocal, max_pending=3)
+    buffer.add({(voters[0], poll_id): first_id, (voters[1], poll_id): first_id})
+    buffer.add({(voters[0], poll_id): second_id})
+    assert buffer.pending == 2
+    buffer.add({(voters[2], poll_id): second_id})
+    with pytest.raises(HTTPException) as excinfo:
+        buffer.add({(10 ** 6, poll_id): second_id})
+    assert excinfo.value.status_code == 503
+    
+    assert asyncio.run(buffer.flush()) == 3
+    assert buffer.pending == 0
+    response = client.get(f"/polls/{poll_id}/results").json()
+    assert [option["votes_count"] for option in response["options"]] == [1, 2]
+
+def test_write_behind_vote_and_batch_ingest(auth_headers, monkeypatch):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    voters = create_voters(2)
+    
+    batch = {"votes": [
+        {"poll_id": poll_id, "option_id": first_id, "user_id": voters[0]},
+        {"poll_id": poll_id, "option_id": second_id, "user_id": voters[1]},
+        {"poll_id": poll_id, "option_id": second_id, "user_id": voters[0]},
+    ]}
+    assert client.post("/polls/votes:batch", json=batch).status_code == 403
+    monkeypatch.setattr(settings, "vote_ingest_key", "ingest-secret")
+    assert client.post("/polls/votes:batch", json=batch, headers={"X-Ingest-Key": "wrong"}).status_code == 403
+    
+    response = client.post("/polls/votes:batch", json=batch, headers={"X-Ingest-Key": "ingest-secret"})
+    assert response.json() == {"received": 3, "accepted": 2}
+    assert client.get(f"/polls/{poll_id}/results").json()["total_votes"] == 2
+    
+    buffer = VoteBuffer(session_factory=TestingSessionLocal)
+    monkeypatch.setattr(settings, "vote_write_behind", True)
+    monkeypatch.setattr("app.polls.routes.vote_buffer", buffer)
+    response = client.post(f"/polls/{poll_id}/vote", json={"option_id": first_id}, headers=auth_headers)
+    assert response.status_code == 202
+    assert response.json() == {"poll_id": poll_id, "option_id": first_id}
+    assert client.post(f"/polls/{poll_id}/vote", json={"option_id": 10 ** 6}, headers=auth_headers).status_code == 400
+    assert buffer.pending == 1
+    
+    asyncio.run(buffer.flush())
+    assert client.get(f"/polls/{poll_id}/results").json()["total_votes"] == 3
+
+def test_multiplexed_websocket_subscriptions(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": first_id}, headers=auth_headers)
+    
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_text(json.dumps({"type": "subscribe", "poll_ids": [poll_id, 10 ** 6]}))
+        # A snapshot of each poll comes before the acknowledgement
+        assert websocket.receive_json() == {
+            "type": "snapshot",
+            "poll_id": poll_id,
+            "seq": 1,
+            "options": [{"option_id": first_id, "votes_count": 1}, {"option_id": second_id, "votes_count": 0}],
+            "total_votes": 1
+        }
+        assert websocket.receive_json()["type"] == "error"
+        assert websocket.receive_json() == {"type": "subscribed", "poll_ids": [poll_id]}
+        websocket.send_text(json.dumps({"type": "unsubscribe", "poll_ids": [poll_id]}))
+        assert websocket.receive_json() == {"type": "unsubscribed", "poll_ids": [poll_id]}
+
+def test_poll_websocket_answers_pings_instead_of_echoing(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    
+    with client.websocket_connect(f"/polls/ws/{poll_id}") as websocket:
+        assert websocket.receive_json()["type"] == "snapshot"
+        websocket.send_text("hello")
+        websocket.send_text(json.dumps({"type": "ping"}))
+        assert websocket.receive_json() == {"type": "pong"}
+
+def test_poll_stream_of_a_missing_poll(auth_headers):
+    assert client.get("/polls/999999/stream").status_code == 404
+
+def test_resume_across_a_moved_vote(auth_headers):
+    create_response = client.post("/polls/", json={
+        "title": "Test Poll",
+        "description": "This is a test poll",
+        "options": ["Option 1", "Option 2"]
+    }, headers=auth_headers)
+    poll_id = create_response.json()["id"]
+    first_id, second_id = [option["id"] for option in create_response.json()["options"]]
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": first_id}, headers=auth_headers)
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": second_id}, headers=auth_headers)
+    
+    db = TestingSessionLocal()
+    try:
+        payloads = [message.payload for message in db.query(OutboxMessage).order_by(OutboxMessage.id)]
+    finally:
+        db.close()
+    
+    class Socket:
+        def __init__(self):
+            self.sent = []
+        
+        async def accept(self):
+            pass
+        
+        async def send_text(self, data):
+            self.sent.append(json.loads(data))
+    
+    async def scenario():
+        manager = ConnectionManager()
+        for payload in payloads:
+            await manager.broadcast_to_poll(poll_id, PollUpdateMessage.model_validate_json(payload))
+        # Saw the first vote only
+        websocket = Socket()
+        await manager.connect(websocket, poll_id, since=1)
+        await asyncio.sleep(0.01)
+        return websocket.sent
+    
+    # The move takes the old option back down before counting the new one
+    assert asyncio.run(scenario()) == [
+        {"option_id": first_id, "votes_count": 0, "total_votes": 1, "poll_id": poll_id, "seq": 2},
+        {"option_id": second_id, "votes_count": 1, "total_votes": 1, "poll_id": poll_id, "seq": 3},
+    ]
+
+def test_websocket_is_released_when_the_snapshot_fails(auth_headers, monkeypatch):
+    def failing_loader(db):
+        async def load_state(poll_id, min_seq):
+            raise RuntimeError("database unavailable")
+        return load_state
+    
+    monkeypatch.setattr("app.polls.routes.poll_state_loader", failing_loader)
+    with pytest.raises(RuntimeError):
+        with client.websocket_connect("/polls/ws/1") as websocket:
+            websocket.receive_json()
+    with pytest.raises(RuntimeError):
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_text(json.dumps({"type": "subscribe", "poll_ids": [1]}))
+            websocket.receive_json()
+    assert manager.clients == {}
@@ -0,0 +1,74 @@
+from datetime import datetime
+from app.polls.cache import PollAggregate, ResultsCache
+
+
+def make_aggregate(poll_id, counts):
+    return PollAggregate(
+        id=poll_id,
+        title="Test Poll",
+        description="This is a test poll",
+        owner_id=1,
+        created_at=datetime(2024, 1, 1),
+        options=tuple((option_id, f"Option {option_id}", count) for option_id, count in counts.items()),
+        total_votes=sum(counts.values())
+    )
+
+def test_hit_miss_and_eviction_counters():
+    cache = ResultsCache(capacity=2, ttl_seconds=60)
+    
+    for poll_id in (1, 2, 3):
+        assert cache.get(poll_id) is None
+        cache.put(poll_id, make_aggregate(poll_id, {1: 0}), cache.version(poll_id))
+    
+    assert cache.get(1) is None
+    assert cache.get(3) is not None
+    assert cache.stats() == {"size": 2, "capacity": 2, "hits": 1, "misses": 4, "evictions": 1}
+
+def test_expired_entries_are_misses():
+    cache = ResultsCache(capacity=2, ttl_seconds=0)
+    cache.put(1, make_aggregate(1, {1: 0}), cache.version(1))
+    
+    assert cache.get(1) is None
+
+def test_votes_update_entries_in_place():
+    cache = ResultsCache(capacity=2, ttl_seconds=60)
+    cache.put(1, make_aggregate(1, {10: 1, 11: 0}), cache.version(1))
+    
+    cache.apply_vote(1, option_id=11, previous_option_id=None)
+    cache.apply_vote(1, option_id=11, previous_option_id=10)
+    
+    aggregate = cache.get(1)
+    assert [count for _, _, count in aggregate.options] == [0, 2]
+    assert aggregate.total_votes == 2
+
+def test_fill_racing_a_vote_is_discarded():
+    cache = ResultsCache(capacity=2, ttl_seconds=60)
+    
+    # Read before the vote committed, stored after it
+    version = cache.version(1)
+    cache.begin_write(1)
+    assert cache.put(1, make_aggregate(1, {10: 0}), version) is False
+    cache.end_write(1)
+    assert cache.put(1, make_aggregate(1, {10: 0}), version) is False
+    
+    assert cache.put(1, make_aggregate(1, {10: 1}), cache.version(1)) is True
+
+def test_out_of_order_vote_drops_entry():
+    cache = ResultsCache(capacity=2, ttl_seconds=60)
+    cache.put(1, make_aggregate(1, {10: 0, 11: 0}), cache.version(1))
+    
+    cache.apply_vote(1, option_id=10, previous_option_id=None, results_version=1)
+    assert cache.get(1).results_version == 1
+    
+    # Version 2 was applied by another worker or has not landed yet
+    cache.apply_vote(1, option_id=11, previous_option_id=None, results_version=3)
+    assert cache.get(1) is None
+
+def test_moved_vote_takes_two_versions():
+    cache = ResultsCache(capacity=2, ttl_seconds=60)
+    cache.put(1, make_aggregate(1, {10: 0, 11: 0}), cache.version(1))
+    
+    cache.apply_vote(1, option_id=10, previous_option_id=None, results_version=1)
+    cache.apply_vote(1, option_id=11, previous_option_id=10, results_version=3)
+    assert cache.get(1).options == ((10, "Option 10", 0), (11, "Option 11", 1))
+    assert cache.get(1).results_version == 3
@@ -92,12 +92,13 @@ export const useVote = () => {
   });
 };
 
-export const usePollResults = (id: string) => {
+export const usePollResults = (id: string, live = false) => {
   return useQuery({
     queryKey: ['poll-results', id],
     queryFn: () => pollsApi.getPollResults(id),
     enabled: !!id,
-    refetchInterval: 5000, // Poll every 5 seconds as fallback
+    // Poll every 5 seconds as fallback while the WebSocket is down
+    refetchInterval: live ? false : 5000,
   });
 };
 
@@ -1,27 +1,32 @@
 import React, { useState } from 'react';
 import { useParams, Link } from 'react-router-dom';
+import { useQueryClient } from '@tanstack/react-query';
 import { usePoll, useVote, usePollResults } from '../api/polls';
 import { VoteOptions } from '../components/VoteOptions';
 import { ResultsChart } from '../components/ResultsChart';
-import { usePollWebSocket } from '../utils/websocket';
-import { PollUpdateMessage } from '../types';
+import { applyPollMessage, usePollWebSocket } from '../utils/websocket';
+import { PollMessage } from '../types';
 
 export const PollDetail: React.FC = () => {
   const { id } = useParams<{ id: string }>();
   const [isRealTime, setIsRealTime] = useState(false);
   const [showVoteSuccess, setShowVoteSuccess] = useState(false);
   
+  const queryClient = useQueryClient();
   const { data: poll, isLoading, error } = usePoll(id!);
-  const { data: results, refetch: refetchResults } = usePollResults(id!);
   const voteMutation = useVote();
 
-  // WebSocket for real-time updates
-  const handleWebSocketUpdate = (_message: PollUpdateMessage) => {
+  // WebSocket for real-time updates, applied to the results in place
+  // rather than refetching them on every message
+  const handleWebSocketUpdate = (message: PollMessage) => {
     setIsRealTime(true);
-    refetchResults();
+    queryClient.setQueryData(['poll-results', id], (current: any) =>
+      current ? applyPollMessage(current, message) : current
+    );
   };
 
   const { isConnected } = usePollWebSocket(id!, handleWebSocketUpdate);
+  const { data: results } = usePollResults(id!, isConnected);
 
   const handleVote = async (optionId: number) => {
     if (!id) return;
@@ -78,8 +78,33 @@ export interface PollUpdateMessage {
   votes_count: number;
   total_votes: number;
   poll_id: number;
+  seq?: number;
 }
 
+export interface OptionCount {
+  option_id: number;
+  votes_count: number;
+}
+
+// Sent first on every (re)connect that cannot resume from `since`
+export interface PollStateMessage {
+  type: 'snapshot';
+  poll_id: number;
+  seq: number;
+  options: OptionCount[];
+  total_votes: number;
+}
+
+// Several updates of one poll merged by the server
+export interface PollSnapshotMessage {
+  poll_id: number;
+  options: OptionCount[];
+  total_votes: number;
+  seq?: number;
+}
+
+export type PollMessage = PollUpdateMessage | PollStateMessage | PollSnapshotMessage;
+
 // API Response types
 export interface ApiResponse<T> {
   data: T;
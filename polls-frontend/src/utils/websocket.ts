@@ -1,36 +1,80 @@
 import React from 'react';
-import { PollUpdateMessage } from '../types';
+import { Poll, PollMessage } from '../types';
 import { config } from '../config/env';
 
 const WS_BASE = config.wsBase;
 
+// Every message carries absolute counts, so applying one just overwrites them
+export const applyPollMessage = <T extends Poll>(poll: T, message: PollMessage): T => {
+  const counts = new Map<number, number>(
+    'options' in message
+      ? message.options.map((option): [number, number] => [option.option_id, option.votes_count])
+      : [[message.option_id, message.votes_count]]
+  );
+  return {
+    ...poll,
+    total_votes: message.total_votes,
+    options: poll.options.map((option) =>
+      counts.has(option.id) ? { ...option, votes_count: counts.get(option.id)! } : option
+    ),
+  };
+};
+
 export class PollWebSocket {
   private ws: WebSocket | null = null;
   private pollId: string;
-  private onUpdate: (message: PollUpdateMessage) => void;
+  private onUpdate: (message: PollMessage) => void;
+  private onStatusChange: (connected: boolean) => void;
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
   private reconnectDelay = 1000;
+  private closedByClient = false;
+  // Last seq applied; a reconnect resumes after it instead of starting over
+  private lastSeq: number | null = null;
 
-  constructor(pollId: string, onUpdate: (message: PollUpdateMessage) => void) {
+  constructor(
+    pollId: string,
+    onUpdate: (message: PollMessage) => void,
+    onStatusChange: (connected: boolean) => void = () => {}
+  ) {
     this.pollId = pollId;
     this.onUpdate = onUpdate;
+    this.onStatusChange = onStatusChange;
   }
 
   connect(): void {
+    this.closedByClient = false;
     try {
-      const wsUrl = `${WS_BASE}/ws/polls/${this.pollId}`;
+      const since = this.lastSeq === null ? '' : `?since=${this.lastSeq}`;
+      const wsUrl = `${WS_BASE}/polls/ws/${this.pollId}${since}`;
       this.ws = new WebSocket(wsUrl);
 
       this.ws.onopen = () => {
         console.log('WebSocket connected');
         this.reconnectAttempts = 0;
+        this.onStatusChange(true);
       };
 
       this.ws.onmessage = (event) => {
         try {
-          const message: PollUpdateMessage = JSON.parse(event.data);
-          this.onUpdate(message);
+          const message = JSON.parse(event.data);
+          if (message.type === 'ping') {
+            // The server closes sockets that stop answering its pings
+            this.ws?.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
+          if (message.type === 'error') {
+            console.error('WebSocket error message:', message.detail);
+            return;
+          }
+          if (typeof message.seq === 'number') {
+            // Updates already covered by a snapshot or applied before
+            if (message.type !== 'snapshot' && this.lastSeq !== null && message.seq <= this.lastSeq) {
+              return;
+            }
+            this.lastSeq = message.seq;
+          }
+          this.onUpdate(message as PollMessage);
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
         }
@@ -38,7 +82,10 @@ export class PollWebSocket {
 
       this.ws.onclose = () => {
         console.log('WebSocket disconnected');
-        this.handleReconnect();
+        this.onStatusChange(false);
+        if (!this.closedByClient) {
+          this.handleReconnect();
+        }
       };
 
       this.ws.onerror = (error) => {
@@ -54,11 +101,13 @@ export class PollWebSocket {
     if (this.reconnectAttempts < this.maxReconnectAttempts) {
       this.reconnectAttempts++;
       const delay = this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1);
-      
+
       console.log(`Attempting to reconnect in ${delay}ms (attempt ${this.reconnectAttempts})`);
-      
+
       setTimeout(() => {
-        this.connect();
+        if (!this.closedByClient) {
+          this.connect();
+        }
       }, delay);
     } else {
       console.error('Max reconnection attempts reached');
@@ -66,6 +115,7 @@ export class PollWebSocket {
   }
 
   disconnect(): void {
+    this.closedByClient = true;
     if (this.ws) {
       this.ws.close();
       this.ws = null;
@@ -80,23 +130,27 @@ export class PollWebSocket {
 // Hook for using WebSocket in components
 export const usePollWebSocket = (
   pollId: string,
-  onUpdate: (message: PollUpdateMessage) => void
+  onUpdate: (message: PollMessage) => void
 ) => {
   const wsRef = React.useRef<PollWebSocket | null>(null);
+  const [isConnected, setIsConnected] = React.useState(false);
+  // The latest callback, without reconnecting whenever it changes
+  const onUpdateRef = React.useRef(onUpdate);
+  onUpdateRef.current = onUpdate;
 
   React.useEffect(() => {
     if (pollId) {
-      wsRef.current = new PollWebSocket(pollId, onUpdate);
+      wsRef.current = new PollWebSocket(pollId, (message) => onUpdateRef.current(message), setIsConnected);
       wsRef.current.connect();
 
       return () => {
         wsRef.current?.disconnect();
       };
     }
-  }, [pollId, onUpdate]);
+  }, [pollId]);
 
   return {
-    isConnected: wsRef.current?.isConnected() || false,
+    isConnected,
     disconnect: () => wsRef.current?.disconnect(),
   };
 };